@@ -2,13 +2,18 @@ import os
 import base64
 import json
 import re
+import threading
 import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timezone
 import streamlit as st
 import cohere
 import gridfs
+import httpx
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import IndexModel, MongoClient
 from pymongo.server_api import ServerApi
 import smtplib
 import html
@@ -378,13 +383,160 @@ HOSTING_YEAR_DISCOUNT_CFA = 19900
 def _format_price(cfa_value):
     usd_value = cfa_value / FX_RATE_CFA_PER_USD
     return f"{cfa_value:,} CFA (~${usd_value:.2f})".replace(",", " ")
+class _CallStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+    def record(self, elapsed_ms, ok=True):
+        with self._lock:
+            self.count += 1
+            if not ok:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.last_ms = elapsed_ms
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+                "max_ms": round(self.max_ms, 1),
+                "last_ms": round(self.last_ms, 1),
+            }
+@st.cache_resource(show_spinner=False)
+def _cohere_stats():
+    return _CallStats()
+class _CircuitBreaker:
+    # Opens after `failures` consecutive errors or budget overruns; one probe call is let
+    # through after `open_seconds`, and its outcome closes or re-opens the breaker.
+    def __init__(self, failures, open_seconds):
+        self._lock = threading.Lock()
+        self.failures = failures
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._probing = False
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state = "closed"
+                self.consecutive = 0
+                self._probing = False
+                return
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+    def release(self):
+        # A call that ended without an outcome (e.g. an interrupted stream) frees the probe.
+        with self._lock:
+            self._probing = False
+@st.cache_resource(show_spinner=False)
+def _cohere_breaker(failures, open_seconds):
+    return _CircuitBreaker(failures, open_seconds)
+@st.cache_resource(show_spinner=False)
+def _cohere_pool():
+    # Calls run here so the script can stop waiting once the latency budget is spent.
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="cohere")
+@st.cache_resource(show_spinner=False)
+def _cohere_client(api_key, connect_timeout, read_timeout):
+    # Shared by every browser session: the httpx pool keeps connections to Cohere alive.
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    http_client = httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60),
+    )
+    return cohere.ClientV2(api_key=api_key, httpx_client=http_client, timeout=timeout)
+def _cohere_call_setup(api_key):
+    cohere_cfg = st.secrets.get("cohere", {})
+    co = _cohere_client(
+        api_key,
+        float(cohere_cfg.get("connect_timeout", 5)),
+        float(cohere_cfg.get("read_timeout", 30)),
+    )
+    breaker = _cohere_breaker(
+        int(cohere_cfg.get("breaker_failures", 5)),
+        float(cohere_cfg.get("breaker_open_seconds", 30)),
+    )
+    if not breaker.allow():
+        raise RuntimeError("cohere_circuit_open")
+    return co, breaker, cohere_cfg
+def _cohere_chat(api_key, model, messages, budget_key="chat_budget_seconds", default_budget=10):
+    co, breaker, cohere_cfg = _cohere_call_setup(api_key)
+    budget = float(cohere_cfg.get(budget_key, default_budget))
+    start = time.perf_counter()
+    future = _cohere_pool().submit(co.chat, model=model, messages=messages)
+    try:
+        resp = future.result(timeout=budget)
+    except FutureTimeout:
+        _cohere_stats().record((time.perf_counter() - start) * 1000, ok=False)
+        breaker.record(False)
+        raise TimeoutError("cohere_budget_exceeded")
+    except Exception:
+        _cohere_stats().record((time.perf_counter() - start) * 1000, ok=False)
+        breaker.record(False)
+        raise
+    _cohere_stats().record((time.perf_counter() - start) * 1000)
+    breaker.record(True)
+    return resp
+def _stream_deltas(stream):
+    for event in stream:
+        if getattr(event, "type", None) != "content-delta":
+            continue
+        text = event.delta.message.content.text if event.delta and event.delta.message else None
+        if text:
+            yield text
+def _cohere_chat_stream(api_key, model, messages):
+    # Yields text as Cohere emits it; the chat budget bounds the wait for the first delta.
+    co, breaker, cohere_cfg = _cohere_call_setup(api_key)
+    budget = float(cohere_cfg.get("chat_budget_seconds", 10))
+    start = time.perf_counter()
+    ok = None
+    try:
+        deltas = _stream_deltas(co.chat_stream(model=model, messages=messages))
+        first = _cohere_pool().submit(next, deltas, None).result(timeout=budget)
+        if first is not None:
+            yield first
+            yield from deltas
+        ok = True
+    except FutureTimeout:
+        ok = False
+        raise TimeoutError("cohere_budget_exceeded")
+    except Exception:
+        ok = False
+        raise
+    finally:
+        # A rerun or stopped fragment closes the generator with GeneratorExit: no outcome,
+        # but the half-open probe must not stay taken for every other session.
+        if ok is None:
+            breaker.release()
+        else:
+            _cohere_stats().record((time.perf_counter() - start) * 1000, ok=ok)
+            breaker.record(ok)
 def _cohere_generate(payload):
     cohere_cfg = st.secrets.get("cohere", {})
     api_key = cohere_cfg.get("api_key")
     model = cohere_cfg.get("model", "command-a-03-2025")
     if not api_key:
         return None, model, "missing_api_key"
-    co = cohere.ClientV2(api_key)
     language_raw = str(payload.get("portfolio_info", {}).get("language", "")).lower()
     language_other = str(payload.get("portfolio_info", {}).get("language_other", "")).strip()
     output_language = "French"
@@ -420,12 +572,15 @@ def _cohere_generate(payload):
         "Input JSON:\n"
         f"{json.dumps(payload, ensure_ascii=True)}"
     )
-    resp = co.chat(
-        model=model,
-        messages=[
+    resp = _cohere_chat(
+        api_key,
+        model,
+        [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
+        budget_key="generate_budget_seconds",
+        default_budget=30,
     )
     text = ""
     try:
@@ -434,6 +589,73 @@ def _cohere_generate(payload):
         text = str(resp)
     parsed, error = _extract_json(text)
     return parsed, model, error
+AI_POLL_SECONDS = 2
+AI_PENDING_TIMEOUT_SECONDS = 180
+@st.cache_resource(show_spinner=False)
+def _ai_pool():
+    # Brief analyses run here, off the script thread, so a submit never waits on the LLM.
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai-brief")
+def _analyze_lead(lead_id, doc=None):
+    try:
+        if doc is None:
+            doc = leads.find_one({"_id": lead_id})
+        if not doc:
+            return
+        local_score = _local_quality_score(doc)
+        ai_payload = _build_ai_payload(doc)
+        ai_result = None
+        ai_status = "failed"
+        ai_error = None
+        ai_model = st.secrets.get("cohere", {}).get("model", "command-a-03-2025")
+        ai_latency_ms = None
+        start_time = time.time()
+        try:
+            ai_result, ai_model, ai_error = _cohere_generate(ai_payload)
+            ai_latency_ms = int((time.time() - start_time) * 1000)
+            if ai_result:
+                ai_status = "success"
+        except Exception as exc:
+            ai_latency_ms = int((time.time() - start_time) * 1000)
+            ai_error = str(exc)
+        if ai_result is not None and not isinstance(ai_result, dict):
+            ai_error = "invalid_ai_response_type"
+            ai_result = None
+            ai_status = "failed"
+        ai_score, ai_score_source = _extract_score(ai_result, local_score)
+        leads.update_one(
+            {"_id": lead_id},
+            {
+                "$set": {
+                    "ai_generated": ai_result,
+                    "ai_status": ai_status,
+                    "ai_model": ai_model,
+                    "ai_latency_ms": ai_latency_ms,
+                    "ai_error": ai_error,
+                    "ai_quality_score": ai_score,
+                    "ai_quality_source": ai_score_source,
+                    "ai_completed_at": datetime.now(timezone.utc),
+                }
+            },
+        )
+    except Exception:
+        try:
+            leads.update_one(
+                {"_id": lead_id, "ai_status": "pending"},
+                {"$set": {"ai_status": "failed", "ai_error": "worker_error"}},
+            )
+        except Exception:
+            pass
+def _submit_ai_analysis(lead_id, doc=None):
+    leads.update_one(
+        {"_id": lead_id},
+        {"$set": {"ai_status": "pending", "ai_requested_at": datetime.now(timezone.utc)}},
+    )
+    _ai_pool().submit(_analyze_lead, lead_id, doc)
+    st.session_state["last_lead_id"] = str(lead_id)
+    st.session_state["last_ai_result"] = None
+    st.session_state["last_ai_score"] = None
+    st.session_state["last_ai_status"] = "pending"
+    st.session_state["last_ai_requested"] = time.time()
 def _init_mode(page):
     params = st.query_params
     qp = params.get("mode")
@@ -449,10 +671,66 @@ mongo = st.secrets["mongodb"]
 uri = mongo["uri"]
 db_name = mongo.get("db", "portfolio")
 col_name = mongo.get("collection", "leads")
-client = MongoClient(uri, server_api=ServerApi("1"))
+# One MongoClient (and its pool) per server process, shared by every session and rerun.
+# PyMongo's own monitors reconnect after an outage, so the process-wide client is never
+# replaced; the ping below (at most every MONGO_HEALTH_SECONDS) only reports its state.
+MONGO_HEALTH_SECONDS = 30
+@st.cache_resource(show_spinner=False)
+def _mongo_health():
+    return {"ok": None, "checked_at": 0.0, "failures": 0, "error": None}
+def _check_mongo(client):
+    state = _mongo_health()
+    if time.monotonic() - state["checked_at"] < MONGO_HEALTH_SECONDS:
+        return state
+    state["checked_at"] = time.monotonic()
+    try:
+        client.admin.command("ping")
+        state.update(ok=True, failures=0, error=None)
+    except Exception as exc:
+        state.update(ok=False, failures=state["failures"] + 1, error=str(exc)[:200])
+    return state
+@st.cache_resource(show_spinner=False)
+def _mongo_client(uri):
+    return MongoClient(
+        uri,
+        server_api=ServerApi("1"),
+        maxPoolSize=int(mongo.get("max_pool_size", 20)),
+        serverSelectionTimeoutMS=int(mongo.get("server_selection_timeout_ms", 5000)),
+    )
+@st.cache_resource(show_spinner=False)
+def _gridfs(_client, db_name):
+    return gridfs.GridFS(_client[db_name])
+client = _mongo_client(uri)
 db = client[db_name]
 leads = db[col_name]
-fs = gridfs.GridFS(db)
+fs = _gridfs(client, db_name)
+# Index registry for the collections this app writes; applied once per server process.
+LEAD_INDEXES = [
+    IndexModel([("created_at", -1)], name="created_at"),
+    IndexModel([("email", 1)], name="email"),
+    IndexModel([("lead_status", 1), ("created_at", -1)], name="lead_status_created_at"),
+    IndexModel([("lead_mode", 1), ("created_at", -1)], name="lead_mode_created_at"),
+]
+GRIDFS_INDEXES = [
+    IndexModel([("metadata.lead_email", 1)], name="metadata_lead_email"),
+]
+# Same bucket layout as the API's chat_logs: {session_id, bucket, count, messages[{seq, ...}]}.
+CHAT_LOG_INDEXES = [
+    IndexModel([("session_id", 1), ("bucket", 1)], unique=True, name="session_bucket"),
+]
+chat_col_name = mongo.get("chat_collection", "chat_logs")
+chat_logs = db[chat_col_name]
+@st.cache_resource(show_spinner=False)
+def _bootstrap_indexes(db_name, col_name, chat_col_name):
+    errors = {}
+    registry = ((col_name, LEAD_INDEXES), ("fs.files", GRIDFS_INDEXES), (chat_col_name, CHAT_LOG_INDEXES))
+    for name, models in registry:
+        try:
+            client[db_name][name].create_indexes(models)
+        except Exception as exc:
+            errors[name] = str(exc)
+    return errors
+_bootstrap_indexes(db_name, col_name, chat_col_name)
 page = st.query_params.get("page") or "home"
 page = str(page).lower()
 mode = _init_mode(page)
@@ -493,13 +771,7 @@ def _render_home():
             st.query_params["mode"] = "B"
             st.rerun()
 ADMIN_MODE = bool(st.secrets.get("admin", {}).get("enabled", False))
-def _sales_agent_reply(user_message, history):
-    cohere_cfg = st.secrets.get("cohere", {})
-    api_key = cohere_cfg.get("api_key")
-    model = cohere_cfg.get("model", "command-a-03-2025")
-    if not api_key:
-        return "Service indisponible pour le moment. Contactez-nous sur WhatsApp."
-    co = cohere.ClientV2(api_key)
+def _sales_agent_messages(user_message, history):
     system_prompt = (
         "You are a strong sales assistant for a portfolio service. "
         "Answer in French, concise, confident, and helpful. "
@@ -510,33 +782,104 @@ def _sales_agent_reply(user_message, history):
         "Ask one short clarifying question and guide to conversion."
     )
     messages = [{"role": "system", "content": system_prompt}]
-    for item in history[-6:]:
+    for item in list(history)[-6:]:
         messages.append({"role": "user", "content": item["user"]})
         messages.append({"role": "assistant", "content": item["assistant"]})
     messages.append({"role": "user", "content": user_message})
+    return messages
+def _sales_agent_stream(user_message, history):
+    cohere_cfg = st.secrets.get("cohere", {})
+    api_key = cohere_cfg.get("api_key")
+    model = cohere_cfg.get("model", "command-a-03-2025")
+    if not api_key:
+        yield "Service indisponible pour le moment. Contactez-nous sur WhatsApp."
+        return
+    streamed = False
     try:
-        resp = co.chat(model=model, messages=messages)
-        return resp.message.content[0].text
+        for text in _cohere_chat_stream(api_key, model, _sales_agent_messages(user_message, history)):
+            streamed = True
+            yield text
     except Exception:
-        return "Je peux aider sur le service. Posez votre question ou contactez-nous sur WhatsApp."
-def _render_chat_html(messages, typing_text=""):
-    rows = []
-    for item in messages:
-        user = html.escape(item.get("user", ""))
-        assistant = html.escape(item.get("assistant", ""))
-        rows.append(
-            f'<div class="sidebar-chat-msg"><span class="sidebar-chat-user">Vous:</span> {user}</div>'
-        )
-        rows.append(
-            f'<div class="sidebar-chat-msg"><span class="sidebar-chat-user">Assistant:</span> '
-            f'<span class="sidebar-chat-bot">{assistant}</span></div>'
+        if not streamed:
+            yield "Je peux aider sur le service. Posez votre question ou contactez-nous sur WhatsApp."
+def _chat_user_row(user_html):
+    return f'<div class="sidebar-chat-msg"><span class="sidebar-chat-user">Vous:</span> {user_html}</div>'
+def _chat_bot_row(assistant_html):
+    return (
+        f'<div class="sidebar-chat-msg"><span class="sidebar-chat-user">Assistant:</span> '
+        f'<span class="sidebar-chat-bot">{assistant_html}</span></div>'
+    )
+def _chat_box(rows_html):
+    return '<div class="sidebar-chat-box">' + rows_html + "</div>"
+# The sidebar keeps the last SALES_CHAT_VISIBLE_TURNS turns in a ring buffer; a turn pushed out
+# of it is written to chat_logs and can be paged back with "load earlier". Each turn carries
+# its escaped HTML, built once, so a render only joins ready-made strings.
+SALES_CHAT_VISIBLE_TURNS = 12
+CHAT_BUCKET_SIZE = 50
+def _sales_turn(seq, at, user, assistant):
+    return {
+        "seq": seq,
+        "at": at,
+        "user": user,
+        "assistant": assistant,
+        "html": _chat_user_row(html.escape(user)) + _chat_bot_row(html.escape(assistant)),
+    }
+def _sales_chat_init():
+    state = st.session_state
+    if not isinstance(state.get("sales_chat"), deque):
+        state["sales_chat"] = deque(maxlen=SALES_CHAT_VISIBLE_TURNS)
+    state.setdefault("sales_chat_session", f"streamlit_{uuid.uuid4().hex}")
+    state.setdefault("sales_chat_seq", 0)
+    state.setdefault("sales_chat_earlier", [])
+    state.setdefault("sales_chat_has_earlier", False)
+def _flush_sales_turn(turn):
+    message = {k: turn[k] for k in ("seq", "at", "user", "assistant")}
+    message["source"] = "streamlit_sidebar"
+    try:
+        chat_logs.update_one(
+            {"session_id": st.session_state["sales_chat_session"], "bucket": turn["seq"] // CHAT_BUCKET_SIZE},
+            {
+                "$setOnInsert": {"created_at": turn["at"]},
+                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()},
+                "$inc": {"count": 1},
+                "$push": {"messages": message},
+            },
+            upsert=True,
         )
-    if typing_text:
-        rows.append(
-            f'<div class="sidebar-chat-msg"><span class="sidebar-chat-user">Assistant:</span> '
-            f'<span class="sidebar-chat-bot">{html.escape(typing_text)}</span></div>'
+    except Exception:
+        pass
+def _append_sales_turn(user, assistant):
+    turns = st.session_state["sales_chat"]
+    seq = st.session_state["sales_chat_seq"]
+    st.session_state["sales_chat_seq"] = seq + 1
+    if len(turns) == turns.maxlen:
+        _flush_sales_turn(turns[0])
+        st.session_state["sales_chat_has_earlier"] = True
+    turns.append(_sales_turn(seq, datetime.now(timezone.utc).isoformat(), user, assistant))
+def _load_earlier_sales_turns():
+    # One chat_logs bucket per click, older than the oldest turn already on screen.
+    earlier = st.session_state["sales_chat_earlier"]
+    visible = st.session_state["sales_chat"]
+    oldest = earlier[0]["seq"] if earlier else (visible[0]["seq"] if visible else 0)
+    loaded = []
+    if oldest > 0:
+        try:
+            doc = chat_logs.find_one(
+                {"session_id": st.session_state["sales_chat_session"], "bucket": (oldest - 1) // CHAT_BUCKET_SIZE},
+                {"messages": 1},
+            )
+        except Exception:
+            doc = None
+        messages = sorted(
+            (m for m in (doc or {}).get("messages", []) if m.get("seq", oldest) < oldest),
+            key=lambda m: m["seq"],
         )
-    return '<div class="sidebar-chat-box">' + "".join(rows) + "</div>"
+        loaded = [_sales_turn(m["seq"], m.get("at"), m.get("user", ""), m.get("assistant", "")) for m in messages]
+    earlier[:0] = loaded
+    st.session_state["sales_chat_has_earlier"] = bool(loaded) and loaded[0]["seq"] > 0
+def _sales_transcript_html():
+    turns = st.session_state["sales_chat_earlier"] + list(st.session_state["sales_chat"])
+    return "".join(turn["html"] for turn in turns)
 def _render_sales_sidebar():
     mode = st.session_state.get("mode", "A")
     main_price = PRICE_A if mode == "A" else PRICE_B
@@ -572,13 +915,23 @@ def _render_sales_sidebar():
         """,
         unsafe_allow_html=True,
     )
-    st.session_state.setdefault("sales_chat", [])
-    chat_placeholder = st.sidebar.empty()
-    chat_placeholder.markdown(
-        _render_chat_html(st.session_state["sales_chat"]),
-        unsafe_allow_html=True,
-    )
-    with st.sidebar.form("sales_form", clear_on_submit=True):
+    with st.sidebar:
+        _sales_chat_fragment()
+@st.fragment
+def _sales_chat_fragment():
+    # Sending a message reruns only this fragment, not the CSS, hero image and forms of the page;
+    # the transcript is redrawn in place, so no further rerun is needed.
+    # Fragments cannot write to st.sidebar themselves: the caller opens the sidebar context.
+    _sales_chat_init()
+    if st.session_state["sales_chat_has_earlier"]:
+        earlier_slot = st.empty()
+        if earlier_slot.button("Afficher les messages precedents", key="sales_chat_load_earlier"):
+            _load_earlier_sales_turns()
+            if not st.session_state["sales_chat_has_earlier"]:
+                earlier_slot.empty()
+    chat_placeholder = st.empty()
+    chat_placeholder.markdown(_chat_box(_sales_transcript_html()), unsafe_allow_html=True)
+    with st.form("sales_form", clear_on_submit=True):
         col_input, col_btn = st.columns([5, 1])
         with col_input:
             user_input = st.text_input(
@@ -590,19 +943,22 @@ def _render_sales_sidebar():
         with col_btn:
             submitted = st.form_submit_button(">")
         if submitted and user_input.strip():
-            reply = _sales_agent_reply(user_input.strip(), st.session_state["sales_chat"])
-            typing = ""
-            for i in range(0, len(reply), 3):
-                typing = reply[: i + 3]
-                chat_placeholder.markdown(
-                    _render_chat_html(st.session_state["sales_chat"], typing_text=typing),
-                    unsafe_allow_html=True,
-                )
-                time.sleep(0.02)
-            st.session_state["sales_chat"].append(
-                {"user": user_input.strip(), "assistant": reply}
-            )
-            st.rerun()
+            question = user_input.strip()
+            history = st.session_state["sales_chat"]
+            # Each delta only escapes its own text, and repaints are capped at ~20 per second
+            # however fast tokens arrive.
+            prefix = _sales_transcript_html() + _chat_user_row(html.escape(question))
+            reply = []
+            reply_html = ""
+            last_paint = 0.0
+            for text in _sales_agent_stream(question, history):
+                reply.append(text)
+                reply_html += html.escape(text)
+                if time.monotonic() - last_paint >= 0.05:
+                    chat_placeholder.markdown(_chat_box(prefix + _chat_bot_row(reply_html)), unsafe_allow_html=True)
+                    last_paint = time.monotonic()
+            _append_sales_turn(question, "".join(reply))
+            chat_placeholder.markdown(_chat_box(_sales_transcript_html()), unsafe_allow_html=True)
 if page != "service" or mode not in ("A", "B"):
     _render_home()
     st.stop()
@@ -619,6 +975,73 @@ if new_mode != mode:
     st.rerun()
 mode = new_mode
 _render_sales_sidebar()
+class _SmtpSession:
+    # One authenticated SMTP connection per server process, shared by every browser session.
+    def __init__(self, host, port, username, password, idle_seconds=60):
+        self.config = (host, port, username, password)
+        self.idle_seconds = idle_seconds
+        self.sent = 0
+        self.failed = 0
+        self.reconnects = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self._lock = threading.Lock()
+        self._server = None
+        self._last_used = 0.0
+    def _connect(self):
+        host, port, username, password = self.config
+        server = smtplib.SMTP(host, port, timeout=10)
+        try:
+            server.starttls()
+            server.login(username, password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+    def _reset(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+        self._server = None
+    def send(self, msg):
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                if self._server is not None and time.monotonic() - self._last_used > self.idle_seconds:
+                    self._reset()
+                for attempt in range(2):
+                    if self._server is None:
+                        self._connect()
+                    try:
+                        self._server.send_message(msg)
+                        break
+                    except (smtplib.SMTPServerDisconnected, ConnectionError):
+                        self._reset()
+                        self.reconnects += 1
+                        if attempt:
+                            raise
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.last_ms = (time.perf_counter() - start) * 1000
+                self.total_ms += self.last_ms
+            self.sent += 1
+            self._last_used = time.monotonic()
+    def stats(self):
+        count = self.sent + self.failed
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "reconnects": self.reconnects,
+            "avg_ms": round(self.total_ms / count, 1) if count else 0.0,
+            "last_ms": round(self.last_ms, 1),
+        }
+@st.cache_resource(show_spinner=False)
+def _smtp_session(host, port, username, password):
+    return _SmtpSession(host, port, username, password)
 def _send_lead_email(doc, lead_id):
     smtp_cfg = st.secrets.get("smtp", {})
     host = smtp_cfg.get("host")
@@ -671,13 +1094,34 @@ def _send_lead_email(doc, lead_id):
         )
     msg.set_content(body)
     try:
-        with smtplib.SMTP(host, port, timeout=10) as server:
-            server.starttls()
-            server.login(username, password)
-            server.send_message(msg)
+        _smtp_session(host, port, username, password).send(msg)
         return True, None
     except Exception as exc:
         return False, str(exc)
+def _render_admin_status():
+    mongo_state = _check_mongo(client)
+    with st.sidebar.expander("Etat des services"):
+        if mongo_state["ok"]:
+            st.write("MongoDB: OK")
+        else:
+            st.write(f"MongoDB: indisponible ({mongo_state['failures']} echecs) {mongo_state['error'] or ''}")
+        smtp_cfg = st.secrets.get("smtp", {})
+        smtp_key = (smtp_cfg.get("host"), int(smtp_cfg.get("port", 587)), smtp_cfg.get("username"), smtp_cfg.get("password"))
+        if all(smtp_key):
+            smtp = _smtp_session(*smtp_key).stats()
+            st.write(
+                f"SMTP: {smtp['sent']} envoyes, {smtp['failed']} echecs, {smtp['reconnects']} reconnexions, "
+                f"moy. {smtp['avg_ms']} ms, dernier {smtp['last_ms']} ms"
+            )
+        else:
+            st.write("SMTP: non configure")
+        cohere = _cohere_stats().snapshot()
+        st.write(
+            f"Cohere: {cohere['count']} appels, {cohere['errors']} erreurs, moy. {cohere['avg_ms']} ms, "
+            f"max {cohere['max_ms']} ms, dernier {cohere['last_ms']} ms"
+        )
+if ADMIN_MODE:
+    _render_admin_status()
 # -------------------------
 if page == "service":
     # Header / Hero
@@ -1172,6 +1616,7 @@ if mode == "B":
             st.info("Fichiers recus: " + ", ".join(f"{f['name']} ({_format_mb(f.get('size', 0))})" for f in stored_files))
 
         st.session_state["last_lead_id"] = str(res.inserted_id) if res else ""
+        st.session_state["last_ai_status"] = None
         for key in FORM_B_KEYS:
             st.session_state[key] = ""
         if "b_logo" in st.session_state:
@@ -1427,125 +1872,114 @@ with st.form("lead_form", clear_on_submit=True):
                     )
             if not db_ok:
                 st.stop()
-            local_score = _local_quality_score(doc)
-            ai_payload = _build_ai_payload(doc)
-            ai_result = None
-            ai_status = "failed"
-            ai_error = None
-            ai_model = st.secrets.get("cohere", {}).get("model", "command-a-03-2025")
-            ai_latency_ms = None
-            start_time = time.time()
-            try:
-                ai_result, ai_model, ai_error = _cohere_generate(ai_payload)
-                ai_latency_ms = int((time.time() - start_time) * 1000)
-                if ai_result:
-                    ai_status = "success"
-            except Exception as exc:
-                ai_latency_ms = int((time.time() - start_time) * 1000)
-                ai_error = str(exc)
-            if ai_result is not None and not isinstance(ai_result, dict):
-                ai_error = "invalid_ai_response_type"
-                ai_result = None
-                ai_status = "failed"
-            ai_score, ai_score_source = _extract_score(ai_result, local_score)
-            leads.update_one(
-                {"_id": res.inserted_id},
-                {
-                    "$set": {
-                        "ai_generated": ai_result,
-                        "ai_status": ai_status,
-                        "ai_model": ai_model,
-                        "ai_latency_ms": ai_latency_ms,
-                        "ai_error": ai_error,
-                        "ai_quality_score": ai_score,
-                        "ai_quality_source": ai_score_source,
-                    }
-                },
-            )
-            if ai_status != "success":
-                st.warning("Analyse IA indisponible pour le moment.")
-            else:
-                if ai_score < 60:
-                    st.warning("Brief incomplet. Merci de repondre aux questions ci-dessous.")
-                    questions = _normalize_list(ai_result.get("clarifying_questions"))
-                    for item in questions:
-                        st.write(f"- {item}")
-                else:
-                    st.subheader("Resume du brief")
-                    summary = _normalize_list(ai_result.get("brief_summary"))
-                    for line in summary:
-                        st.write(f"- {line}")
-                    st.subheader("Plan du portfolio")
-                    plan = ai_result.get("portfolio_plan") or []
-                    for item in plan:
-                        if not isinstance(item, dict):
-                            continue
-                        section = item.get("section", "Section")
-                        content = item.get("content", "")
-                        priority = item.get("priority", "")
-                        st.markdown(f"**{section}** ({priority})")
-                        if content:
-                            st.write(content)
-                    st.subheader("Checklist des elements a fournir")
-                    checklist = _normalize_list(ai_result.get("assets_checklist"))
-                    for item in checklist:
-                        st.write(f"- {item}")
-                    if ADMIN_MODE:
-                        st.subheader("Message WhatsApp")
-                        whatsapp_message = ai_result.get("whatsapp_message", "")
-                        if st.button("Copier message WhatsApp"):
-                            st.toast("Message pret a copier ci-dessous.")
-                        st.text_area("Message WhatsApp", value=whatsapp_message, height=160)
-                        st.subheader("Livrables")
-                        deliverables = _normalize_list(ai_result.get("deliverables"))
-                        for item in deliverables:
-                            st.write(f"- {item}")
-                        estimate = ai_result.get("estimate", {})
-                        if isinstance(estimate, dict):
-                            price_range = estimate.get("price_range")
-                            eta_days = estimate.get("eta_days")
-                            risk_level = estimate.get("risk_level")
-                            st.markdown("**Estimation**")
-                            st.write(f"Prix: {price_range} | Delai: {eta_days} jours | Risque: {risk_level}")
-                        tags = _normalize_list(ai_result.get("internal_tags"))
-                        if tags:
-                            st.markdown("**Tags internes**")
-                            st.write(", ".join(tags))
-                        if stored_files:
-                            st.subheader("Fichiers uploades")
-                            for item in stored_files:
-                                file_id = item.get("file_id")
-                                label = f"{item.get('name')} ({_format_mb(item.get('size', 0))})"
-                                try:
-                                    grid_file = fs.get(ObjectId(file_id))
-                                    st.download_button(
-                                        label=f"Telecharger {label}",
-                                        data=grid_file.read(),
-                                        file_name=item.get("name"),
-                                        mime=item.get("type") or "application/octet-stream",
-                                    )
-                                except Exception:
-                                    st.write(f"Fichier indisponible: {label}")
             if stored_files:
                 st.info(
                     "Fichiers recus: "
                     + ", ".join(f"{f['name']} ({_format_mb(f.get('size', 0))})" for f in stored_files)
                 )
-            st.session_state["last_lead_id"] = str(res.inserted_id)
-            st.session_state["last_ai_result"] = ai_result
-            st.session_state["last_ai_score"] = ai_score
-            st.session_state["last_ai_status"] = ai_status
-            for key in FORM_KEYS:
+            _submit_ai_analysis(res.inserted_id, doc)
+            st.session_state["last_stored_files"] = stored_files
+            for key in FORM_A_KEYS:
                 st.session_state[key] = ""
             if "uploaded_files" in st.session_state:
                 st.session_state.pop("uploaded_files")
 # Footer
 st.write("")
 st.caption("© Portfolio — Brief & demande de devis")
+def _render_ai_result(ai_result, ai_score, stored_files):
+    if ai_score < 60:
+        st.warning("Brief incomplet. Merci de repondre aux questions ci-dessous.")
+        questions = _normalize_list(ai_result.get("clarifying_questions"))
+        for item in questions:
+            st.write(f"- {item}")
+        return
+    st.subheader("Resume du brief")
+    summary = _normalize_list(ai_result.get("brief_summary"))
+    for line in summary:
+        st.write(f"- {line}")
+    st.subheader("Plan du portfolio")
+    plan = ai_result.get("portfolio_plan") or []
+    for item in plan:
+        if not isinstance(item, dict):
+            continue
+        section = item.get("section", "Section")
+        content = item.get("content", "")
+        priority = item.get("priority", "")
+        st.markdown(f"**{section}** ({priority})")
+        if content:
+            st.write(content)
+    st.subheader("Checklist des elements a fournir")
+    checklist = _normalize_list(ai_result.get("assets_checklist"))
+    for item in checklist:
+        st.write(f"- {item}")
+    if ADMIN_MODE:
+        st.subheader("Message WhatsApp")
+        whatsapp_message = ai_result.get("whatsapp_message", "")
+        if st.button("Copier message WhatsApp"):
+            st.toast("Message pret a copier ci-dessous.")
+        st.text_area("Message WhatsApp", value=whatsapp_message, height=160)
+        st.subheader("Livrables")
+        deliverables = _normalize_list(ai_result.get("deliverables"))
+        for item in deliverables:
+            st.write(f"- {item}")
+        estimate = ai_result.get("estimate", {})
+        if isinstance(estimate, dict):
+            price_range = estimate.get("price_range")
+            eta_days = estimate.get("eta_days")
+            risk_level = estimate.get("risk_level")
+            st.markdown("**Estimation**")
+            st.write(f"Prix: {price_range} | Delai: {eta_days} jours | Risque: {risk_level}")
+        tags = _normalize_list(ai_result.get("internal_tags"))
+        if tags:
+            st.markdown("**Tags internes**")
+            st.write(", ".join(tags))
+        if stored_files:
+            st.subheader("Fichiers uploades")
+            for item in stored_files:
+                file_id = item.get("file_id")
+                label = f"{item.get('name')} ({_format_mb(item.get('size', 0))})"
+                try:
+                    grid_file = fs.get(ObjectId(file_id))
+                    st.download_button(
+                        label=f"Telecharger {label}",
+                        data=grid_file.read(),
+                        file_name=item.get("name"),
+                        mime=item.get("type") or "application/octet-stream",
+                    )
+                except Exception:
+                    st.write(f"Fichier indisponible: {label}")
+@st.fragment(run_every=AI_POLL_SECONDS)
+def _ai_status_fragment():
+    # Only this block reruns while the worker is busy; a finished analysis triggers one full rerun.
+    lead_id = st.session_state.get("last_lead_id")
+    try:
+        lead = leads.find_one(
+            {"_id": ObjectId(lead_id)},
+            {"ai_status": 1, "ai_generated": 1, "ai_quality_score": 1},
+        )
+    except Exception:
+        lead = None
+    status = (lead or {}).get("ai_status", "pending")
+    if status == "pending":
+        waited = time.time() - st.session_state.get("last_ai_requested", time.time())
+        if waited < AI_PENDING_TIMEOUT_SECONDS:
+            st.info("Analyse IA du brief en cours... Le resultat s'affichera ici automatiquement.")
+            return
+        status = "failed"
+    st.session_state["last_ai_status"] = status
+    st.session_state["last_ai_result"] = (lead or {}).get("ai_generated")
+    st.session_state["last_ai_score"] = (lead or {}).get("ai_quality_score")
+    st.rerun()
 last_lead_id = st.session_state.get("last_lead_id")
 last_ai_result = st.session_state.get("last_ai_result")
 last_ai_score = st.session_state.get("last_ai_score")
 last_ai_status = st.session_state.get("last_ai_status")
+if last_lead_id and last_ai_status == "pending":
+    _ai_status_fragment()
+elif last_lead_id and last_ai_status == "failed":
+    st.warning("Analyse IA indisponible pour le moment.")
+elif last_lead_id and last_ai_status == "success" and isinstance(last_ai_result, dict) and isinstance(last_ai_score, int):
+    _render_ai_result(last_ai_result, last_ai_score, st.session_state.get("last_stored_files") or [])
 if last_lead_id and last_ai_status == "success" and isinstance(last_ai_score, int) and last_ai_score < 60:
     st.markdown("### Precisions manquantes")
     questions = _normalize_list(last_ai_result.get("clarifying_questions") if last_ai_result else [])
@@ -1571,43 +2005,5 @@ if last_lead_id and last_ai_status == "success" and isinstance(last_ai_score, in
                 }
             },
         )
-        updated_doc = leads.find_one({"_id": lead_id})
-        local_score = _local_quality_score(updated_doc)
-        ai_payload = _build_ai_payload(updated_doc)
-        ai_result = None
-        ai_status = "failed"
-        ai_error = None
-        ai_model = st.secrets.get("cohere", {}).get("model", "command-a-03-2025")
-        ai_latency_ms = None
-        start_time = time.time()
-        try:
-            ai_result, ai_model, ai_error = _cohere_generate(ai_payload)
-            ai_latency_ms = int((time.time() - start_time) * 1000)
-            if ai_result:
-                ai_status = "success"
-        except Exception as exc:
-            ai_latency_ms = int((time.time() - start_time) * 1000)
-            ai_error = str(exc)
-        if ai_result is not None and not isinstance(ai_result, dict):
-            ai_error = "invalid_ai_response_type"
-            ai_result = None
-            ai_status = "failed"
-        ai_score, ai_score_source = _extract_score(ai_result, local_score)
-        leads.update_one(
-            {"_id": lead_id},
-            {
-                "$set": {
-                    "ai_generated": ai_result,
-                    "ai_status": ai_status,
-                    "ai_model": ai_model,
-                    "ai_latency_ms": ai_latency_ms,
-                    "ai_error": ai_error,
-                    "ai_quality_score": ai_score,
-                    "ai_quality_source": ai_score_source,
-                }
-            },
-        )
-        st.session_state["last_ai_result"] = ai_result
-        st.session_state["last_ai_score"] = ai_score
-        st.session_state["last_ai_status"] = ai_status
+        _submit_ai_analysis(lead_id)
         st.rerun()
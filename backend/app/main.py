@@ -1,14 +1,54 @@
-from datetime import datetime, timezone
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import hashlib
+import hmac
+import csv
+import io
+import json
+import math
 import os
+import re
 import smtplib
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
 from email.message import EmailMessage
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from bson import ObjectId
+from pymongo import IndexModel, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import cohere
+import httpx
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    if _env("MONGO_URI", "uri"):
+        try:
+            await asyncio.to_thread(_open_mongo)
+            await asyncio.to_thread(_ensure_indexes)
+        except Exception:
+            pass
+        _start_outbox_worker()
+    try:
+        yield
+    finally:
+        _stop_outbox_worker()
+        _close_mongo()
+
 
-app = FastAPI(title="Portfolio API", version="0.8.0")
+app = FastAPI(title="Portfolio API", version="0.8.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -210,22 +250,660 @@ def _usd(value: int) -> str:
     return f"{value / RATE:.2f}"
 
 
+def _leads_collection_name() -> str:
+    return _env("MONGO_COLLECTION", default="service_requests")
+
+
+def _chat_collection_name() -> str:
+    return _env("MONGO_CHAT_COLLECTION", "chat_collection", default="chat_logs")
+
+
+def _chat_session_collection_name() -> str:
+    return _env("MONGO_CHAT_SESSION_COLLECTION", default="chat_sessions")
+
+
+def _outbox_collection_name() -> str:
+    return _env("MONGO_OUTBOX_COLLECTION", default="notification_outbox")
+
+
+def _stats_collection_name() -> str:
+    return _env("MONGO_STATS_COLLECTION", default="stats_daily")
+
+
+# One pooled client per worker process, opened by the lifespan handler.
+_mongo_lock = threading.Lock()
+_mongo = {"client": None, "db": None, "collections": {}}
+
+
+def _open_mongo():
+    with _mongo_lock:
+        if _mongo["client"] is not None:
+            return _mongo["db"]
+
+        mongo_uri = _env("MONGO_URI", "uri")
+        mongo_db = _env("MONGO_DB", "db", default="portfolio")
+
+        if not mongo_uri:
+            raise RuntimeError("MONGO_URI is not set")
+
+        client = MongoClient(
+            mongo_uri,
+            serverSelectionTimeoutMS=8000,
+            maxPoolSize=int(_env("MONGO_MAX_POOL_SIZE", default="20")),
+            minPoolSize=int(_env("MONGO_MIN_POOL_SIZE", default="1")),
+            maxIdleTimeMS=int(_env("MONGO_MAX_IDLE_MS", default="300000")),
+        )
+        db = client[mongo_db]
+        _mongo["collections"] = {
+            name: db[name]
+            for name in (
+                _leads_collection_name(),
+                _chat_collection_name(),
+                _chat_session_collection_name(),
+                _outbox_collection_name(),
+            )
+        }
+        _mongo["client"] = client
+        _mongo["db"] = db
+
+    # Server selection and the first pooled connection happen here, not on the first request.
+    try:
+        client.admin.command("ping")
+    except Exception:
+        pass
+    return db
+
+
+def _close_mongo():
+    with _mongo_lock:
+        client = _mongo["client"]
+        _mongo.update({"client": None, "db": None, "collections": {}})
+    if client is not None:
+        client.close()
+
+
 def _get_collection(name: str):
-    mongo_uri = _env("MONGO_URI", "uri")
-    mongo_db = _env("MONGO_DB", "db", default="portfolio")
+    collection = _mongo["collections"].get(name)
+    if collection is None:
+        db = _open_mongo()
+        collection = _mongo["collections"].setdefault(name, db[name])
+    return collection
+
+
+# Prometheus text-format metrics, kept per worker process and served on /metrics.
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _metric_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class _Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict = {}
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_metric_labels(self.labels, key)} {value}")
+        return lines
+
+
+class _Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = METRIC_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: dict = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_metric_labels(names, key + (bound,))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_metric_labels(names, key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_metric_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_metric_labels(self.labels, key)} {count}")
+        return lines
+
+
+_metrics: list = []
+_stage_seconds = _Histogram(
+    "portfolio_stage_duration_seconds",
+    "Time spent per pipeline stage.",
+    ("pipeline", "stage", "service_type"),
+)
+_leads_total = _Counter("portfolio_leads_total", "Leads received.", ("service_type", "complete"))
+_chat_replies_total = _Counter("portfolio_chat_replies_total", "Chat replies by answer source.", ("source",))
+_chat_fallbacks_total = _Counter(
+    "portfolio_chat_fallbacks_total", "Chat replies replaced by a local _safe_reply answer.", ("reason",)
+)
+_email_status_total = _Counter("portfolio_email_status_total", "Notification delivery attempts.", ("status",))
+_cohere_errors_total = _Counter("portfolio_cohere_errors_total", "Failed Cohere calls.", ("error",))
+_cohere_hedges_total = _Counter("portfolio_cohere_hedges_total", "Hedged Cohere requests by winner.", ("winner",))
 
-    if not mongo_uri:
-        raise RuntimeError("MONGO_URI is not set")
 
-    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=8000)
-    return client[mongo_db][name]
+def _metric_service_type(service_type) -> str:
+    return service_type if service_type in REQUIRED_FIELDS else "other"
 
 
-def _send_email(subject: str, body: str) -> str:
+@contextmanager
+def _timed(pipeline: str, stage: str, service_type: str = ""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_seconds.observe(
+            time.perf_counter() - start, pipeline=pipeline, stage=stage, service_type=service_type
+        )
+
+
+class _LatencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.recent: deque = deque(maxlen=256)
+
+    def record(self, elapsed_ms: float, ok: bool = True):
+        with self._lock:
+            self.count += 1
+            if not ok:
+                self.errors += 1
+            else:
+                self.recent.append(elapsed_ms)
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.last_ms = elapsed_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+                "max_ms": round(self.max_ms, 1),
+                "last_ms": round(self.last_ms, 1),
+            }
+
+    def percentile(self, q: float, min_samples: int = 20):
+        with self._lock:
+            if len(self.recent) < min_samples:
+                return None
+            ordered = sorted(self.recent)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class _TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Declarative index registry, applied idempotently by the lifespan handler. Every query
+# shape the API runs is listed in QUERY_SHAPES and checked by check_indexes.py.
+def _index_registry() -> dict:
+    return {
+        _leads_collection_name(): [
+            # Every listing sorts on (created_at, _id) so keyset pages never need an in-memory sort.
+            IndexModel([("created_at", -1), ("_id", -1)], name="created_at_id"),
+            IndexModel([("status", 1), ("created_at", -1), ("_id", -1)], name="status_created_at_id"),
+            IndexModel(
+                [("service_type", 1), ("created_at", -1), ("_id", -1)], name="service_type_created_at_id"
+            ),
+            IndexModel([("country", 1), ("created_at", -1), ("_id", -1)], name="country_created_at_id"),
+            IndexModel([("email", 1)], name="email"),
+            IndexModel(
+                [("idempotency_key", 1)],
+                unique=True,
+                partialFilterExpression={"idempotency_key": {"$type": "string"}},
+                name="idempotency_key_unique",
+            ),
+            IndexModel([("batch_id", 1)], sparse=True, name="batch_id"),
+        ],
+        _chat_collection_name(): [
+            IndexModel([("session_id", 1), ("bucket", 1)], unique=True, name="session_bucket"),
+        ],
+        _chat_session_collection_name(): [
+            IndexModel([("session_id", 1)], unique=True, name="session_id_unique"),
+            # Only sessions with undigested messages carry digest_due, so the digest poll
+            # reads the pending few, never the whole history.
+            IndexModel(
+                [("digest_due", 1), ("last_message_at", 1)],
+                partialFilterExpression={"digest_due": True},
+                name="digest_due_last_message_at",
+            ),
+        ],
+        _outbox_collection_name(): [
+            IndexModel([("status", 1), ("next_attempt_at", 1)], name="status_next_attempt_at"),
+            IndexModel([("lead_id", 1)], name="lead_id"),
+            IndexModel(
+                [("finished_at", 1)], expireAfterSeconds=int(OUTBOX_RETENTION_DAYS * 86400), name="finished_at_ttl"
+            ),
+        ],
+    }
+
+
+def _query_shapes() -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        (_leads_collection_name(), {"status": "new"}, [("created_at", -1), ("_id", -1)]),
+        (_leads_collection_name(), {"service_type": "cv"}, [("created_at", -1), ("_id", -1)]),
+        (_leads_collection_name(), {"country": "Togo"}, [("created_at", -1), ("_id", -1)]),
+        (_leads_collection_name(), {"created_at": {"$gte": now.isoformat()}}, [("created_at", -1), ("_id", -1)]),
+        (
+            _leads_collection_name(),
+            {
+                "$or": [
+                    {"created_at": {"$lt": now.isoformat()}},
+                    {"created_at": now.isoformat(), "_id": {"$lt": ObjectId()}},
+                ]
+            },
+            [("created_at", -1), ("_id", -1)],
+        ),
+        (_leads_collection_name(), {"email": "lead@example.com"}, None),
+        (_leads_collection_name(), {"idempotency_key": "key"}, None),
+        (_leads_collection_name(), {"batch_id": "batch"}, None),
+        (_chat_collection_name(), {"session_id": "s", "bucket": {"$gte": 0}}, [("bucket", -1)]),
+        (_chat_session_collection_name(), {"session_id": "s"}, None),
+        (_chat_session_collection_name(), {"digest_due": True, "last_message_at": {"$lte": now}}, None),
+        (
+            _outbox_collection_name(),
+            {"status": {"$in": ["pending", "sending"]}, "next_attempt_at": {"$lte": now}},
+            [("next_attempt_at", 1)],
+        ),
+    ]
+
+
+def _ensure_indexes() -> dict:
+    errors = {}
+    for name, models in _index_registry().items():
+        try:
+            _get_collection(name).create_indexes(models)
+        except Exception as exc:
+            errors[name] = str(exc)
+    return errors
+
+
+# chat_logs holds fixed-size buckets of messages per session ({session_id, bucket, count,
+# messages}); chat_sessions holds one small counter document per session. Every message
+# costs one counter increment and one push into a bounded bucket, whatever the session length.
+CHAT_BUCKET_SIZE = int(_env("CHAT_BUCKET_SIZE", default="50"))
+
+
+def _append_chat_message(session_id: str, message: dict) -> int:
+    now = datetime.now(timezone.utc)
+    session = _get_collection(_chat_session_collection_name()).find_one_and_update(
+        {"session_id": session_id},
+        {
+            "$setOnInsert": {"created_at": now.isoformat()},
+            "$set": {"last_message_at": now, "digest_due": True},
+            "$inc": {"message_count": 1},
+        },
+        projection={"message_count": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    seq = session["message_count"] - 1
+    update = {
+        "$setOnInsert": {"created_at": now.isoformat()},
+        "$set": {"updated_at": now.isoformat()},
+        "$inc": {"count": 1},
+        "$push": {"messages": {"seq": seq, **message}},
+    }
+    bucket_filter = {"session_id": session_id, "bucket": seq // CHAT_BUCKET_SIZE}
+    chats = _get_collection(_chat_collection_name())
+    try:
+        chats.update_one(bucket_filter, update, upsert=True)
+    except DuplicateKeyError:
+        # Two first messages of a bucket raced on the upsert; the bucket exists now.
+        chats.update_one(bucket_filter, update, upsert=True)
+    return seq
+
+
+def _chat_messages_between(session_id: str, start: int, end: int) -> list:
+    if end <= start:
+        return []
+    buckets = _get_collection(_chat_collection_name()).find(
+        {
+            "session_id": session_id,
+            "bucket": {"$gte": start // CHAT_BUCKET_SIZE, "$lte": (end - 1) // CHAT_BUCKET_SIZE},
+        },
+        {"messages": 1},
+    )
+    messages = [m for b in buckets for m in b.get("messages", []) if start <= m.get("seq", -1) < end]
+    return sorted(messages, key=lambda m: m["seq"])
+
+
+def _chat_history_page(session_id: str, before: int | None = None, pages: int = 1) -> dict:
+    query = {"session_id": session_id, "bucket": {"$gte": 0}}
+    if before is not None:
+        query["bucket"]["$lt"] = before
+    buckets = list(
+        _get_collection(_chat_collection_name())
+        .find(query, {"bucket": 1, "messages": 1})
+        .sort("bucket", -1)
+        .limit(pages)
+    )
+    messages = sorted(
+        (m for b in buckets for m in b.get("messages", [])), key=lambda m: m.get("seq", 0)
+    )
+    oldest = buckets[-1]["bucket"] if buckets else None
+    return {
+        "session_id": session_id,
+        "messages": [{k: v for k, v in m.items() if k != "_id"} for m in messages],
+        "next_before": oldest if oldest else None,
+    }
+
+
+# stats_daily holds one counter document per (day, service_type, country) for leads and per
+# (day, source) for chat replies, maintained with $inc upserts on the write paths. The _id
+# starts with the day, so a date range is a single _id index range. backfill_stats.py
+# rebuilds past days from the raw collections.
+def _stats_day(created_at) -> str:
+    return str(created_at or "")[:10] or "unknown"
+
+
+def _stats_country(country) -> str:
+    return str(country or "").strip().title()[:64] or "Unknown"
+
+
+def _email_bucket(status) -> str:
+    return str(status or "unknown").split(":", 1)[0].strip() or "unknown"
+
+
+def _lead_stats_key(doc: dict) -> dict:
+    day = _stats_day(doc.get("created_at"))
+    service_type = _metric_service_type(doc.get("service_type"))
+    country = _stats_country(doc.get("country"))
+    return {
+        "_id": f"{day}|lead|{service_type}|{country}",
+        "day": day,
+        "kind": "lead",
+        "service_type": service_type,
+        "country": country,
+    }
+
+
+def _lead_stats_counts(doc: dict) -> dict:
+    return {
+        "leads": 1,
+        "incomplete" if doc.get("missing_fields") else "complete": 1,
+        f"email.{_email_bucket(doc.get('email_status'))}": 1,
+    }
+
+
+def _chat_stats_key(day: str, source: str) -> dict:
+    return {"_id": f"{day}|chat|{source}", "day": day, "kind": "chat", "source": source}
+
+
+def _stats_upsert(key: dict, counts: dict) -> UpdateOne:
+    fields = {k: v for k, v in key.items() if k != "_id"}
+    return UpdateOne({"_id": key["_id"]}, {"$inc": counts, "$setOnInsert": fields}, upsert=True)
+
+
+def _record_stats(updates: list):
+    if not updates:
+        return
+    try:
+        with _timed("stats", "rollup"):
+            _get_collection(_stats_collection_name()).bulk_write(updates, ordered=False)
+    except Exception:
+        pass
+
+
+def _lead_stats_updates(docs) -> list:
+    grouped: dict = {}
+    for doc in docs:
+        key = _lead_stats_key(doc)
+        counts = grouped.setdefault(key["_id"], (key, {}))[1]
+        for field, value in _lead_stats_counts(doc).items():
+            counts[field] = counts.get(field, 0) + value
+    return [_stats_upsert(key, counts) for key, counts in grouped.values()]
+
+
+def _email_transition_updates(docs, new_status: str) -> list:
+    new_bucket = _email_bucket(new_status)
+    grouped: dict = {}
+    for doc in docs:
+        old_bucket = _email_bucket(doc.get("email_status"))
+        if old_bucket == new_bucket:
+            continue
+        key = _lead_stats_key(doc)
+        counts = grouped.setdefault(key["_id"], (key, {}))[1]
+        counts[f"email.{old_bucket}"] = counts.get(f"email.{old_bucket}", 0) - 1
+        counts[f"email.{new_bucket}"] = counts.get(f"email.{new_bucket}", 0) + 1
+    return [_stats_upsert(key, counts) for key, counts in grouped.values()]
+
+
+def _record_chat_stats(source: str):
+    day = _stats_day(datetime.now(timezone.utc).isoformat())
+    _record_stats([_stats_upsert(_chat_stats_key(day, source), {"messages": 1})])
+
+
+# Throttled replies are counted live but never written to chat_logs, so a rebuild keeps their
+# rollups. Streamlit sidebar turns share chat_logs but are not API replies and are not counted.
+STATS_LIVE_ONLY_SOURCES = ["throttled"]
+
+
+def _rebuild_stats(start_day: str, end_day: str) -> dict:
+    # Recomputes [start_day, end_day) from service_requests and chat_logs, then replaces the rollups.
+    rollups: dict = {}
+    leads = _get_collection(_leads_collection_name()).find(
+        {"created_at": {"$gte": start_day, "$lt": end_day}},
+        {"created_at": 1, "service_type": 1, "country": 1, "missing_fields": 1, "email_status": 1},
+    ).batch_size(1000)
+    for doc in leads:
+        key = _lead_stats_key(doc)
+        counts = rollups.setdefault(key["_id"], (key, {}))[1]
+        for field, value in _lead_stats_counts(doc).items():
+            counts[field] = counts.get(field, 0) + value
+    chats = _get_collection(_chat_collection_name()).find(
+        {}, {"messages.at": 1, "messages.source": 1}
+    ).batch_size(1000)
+    for bucket in chats:
+        for message in bucket.get("messages", []):
+            day = _stats_day(message.get("at"))
+            source = message.get("source") or "unknown"
+            if not start_day <= day < end_day or source.startswith("streamlit_"):
+                continue
+            key = _chat_stats_key(day, source)
+            counts = rollups.setdefault(key["_id"], (key, {}))[1]
+            counts["messages"] = counts.get("messages", 0) + 1
+
+    collection = _get_collection(_stats_collection_name())
+    replacements = []
+    for key, counts in rollups.values():
+        doc = dict(key)
+        for field, value in counts.items():
+            if field.startswith("email."):
+                doc.setdefault("email", {})[field[len("email."):]] = value
+            else:
+                doc[field] = value
+        replacements.append(doc)
+    for doc in replacements:
+        collection.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+    removed = collection.delete_many(
+        {
+            "_id": {"$gte": start_day, "$lt": end_day, "$nin": [doc["_id"] for doc in replacements]},
+            "source": {"$nin": STATS_LIVE_ONLY_SOURCES},
+        }
+    ).deleted_count
+    return {"rollups": len(replacements), "removed": removed}
+
+
+def _smtp_config():
     host = _env("SMTP_HOST", "host")
     port = int(_env("SMTP_PORT", "port", default="587"))
     username = _env("SMTP_USERNAME", "SMTP_USER", "username")
     password = _env("SMTP_PASSWORD", "password")
+    return host, port, username, password
+
+
+# One authenticated SMTP connection per process, reused by consecutive sends.
+class _SmtpSession:
+    def __init__(self, idle_seconds: float):
+        self.idle_seconds = idle_seconds
+        self.send_stats = _LatencyStats()
+        self.connect_stats = _LatencyStats()
+        self.reconnects = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._config = None
+        self._last_used = 0.0
+
+    def _connect(self, config):
+        host, port, username, password = config
+        start = time.perf_counter()
+        server = smtplib.SMTP(host, port, timeout=20)
+        try:
+            server.starttls()
+            server.login(username, password)
+        except Exception:
+            self.connect_stats.record((time.perf_counter() - start) * 1000, ok=False)
+            self._quit(server)
+            raise
+        self.connect_stats.record((time.perf_counter() - start) * 1000)
+        self._server = server
+        self._config = config
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _reset(self):
+        if self._server is not None:
+            self._quit(self._server)
+        self._server = None
+        self._config = None
+
+    def send(self, msg: EmailMessage, config):
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                for attempt in range(2):
+                    if self._server is None or self._config != config:
+                        self._reset()
+                        self._connect(config)
+                    try:
+                        self._server.send_message(msg)
+                        break
+                    except (smtplib.SMTPServerDisconnected, ConnectionError):
+                        # The server dropped an idle session: reconnect once and resend.
+                        self._reset()
+                        self.reconnects += 1
+                        if attempt:
+                            raise
+            except Exception:
+                self.send_stats.record((time.perf_counter() - start) * 1000, ok=False)
+                raise
+            self._last_used = time.monotonic()
+            self.send_stats.record((time.perf_counter() - start) * 1000)
+
+    def close_if_idle(self):
+        with self._lock:
+            if self._server is not None and time.monotonic() - self._last_used > self.idle_seconds:
+                self._reset()
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> dict:
+        return {
+            "send": self.send_stats.snapshot(),
+            "connect": self.connect_stats.snapshot(),
+            "reconnects": self.reconnects,
+            "connected": self._server is not None,
+        }
+
+
+_smtp_session = _SmtpSession(idle_seconds=float(_env("SMTP_IDLE_SECONDS", default="60")))
+
+
+def _send_email(subject: str, body: str) -> str:
+    config = _smtp_config()
+    host, port, username, password = config
     from_email = _env("SMTP_FROM", "from_email", default=username or DEFAULT_NOTIFY_EMAIL)
     to_email = _env(
         "SMTP_TO",
@@ -239,22 +917,421 @@ def _send_email(subject: str, body: str) -> str:
     msg = EmailMessage()
     msg["Subject"] = subject
     msg["From"] = from_email
+    recipients = [item.strip() for item in str(to_email).split(",") if item.strip()]
+    if not recipients:
+        recipients = [DEFAULT_NOTIFY_EMAIL]
+    msg["To"] = ", ".join(recipients)
     msg.set_content(body)
 
     try:
-        with smtplib.SMTP(host, port) as server:
-            server.starttls()
-            server.login(username, password)
-            recipients = [item.strip() for item in str(to_email).split(",") if item.strip()]
-            if not recipients:
-                recipients = [DEFAULT_NOTIFY_EMAIL]
-            msg["To"] = ", ".join(recipients)
-            server.send_message(msg)
+        _smtp_session.send(msg, config)
         return "sent"
     except Exception as exc:
         return f"failed: {exc}"
 
 
+# Notifications are written to an outbox collection and delivered by a background
+# worker, so SMTP latency and outages never reach the HTTP response.
+OUTBOX_MAX_ATTEMPTS = int(_env("OUTBOX_MAX_ATTEMPTS", default="6"))
+OUTBOX_BASE_DELAY_SECONDS = float(_env("OUTBOX_BASE_DELAY_SECONDS", default="30"))
+OUTBOX_MAX_DELAY_SECONDS = float(_env("OUTBOX_MAX_DELAY_SECONDS", default="3600"))
+OUTBOX_LEASE_SECONDS = float(_env("OUTBOX_LEASE_SECONDS", default="120"))
+OUTBOX_POLL_SECONDS = float(_env("OUTBOX_POLL_SECONDS", default="15"))
+# Finished entries (sent, skipped, failed) carry a BSON finished_at date that a TTL index expires.
+OUTBOX_RETENTION_DAYS = float(_env("OUTBOX_RETENTION_DAYS", default="14"))
+
+_outbox_wakeup = threading.Event()
+_outbox_stop = threading.Event()
+_outbox_thread: threading.Thread | None = None
+
+
+def _enqueue_email(subject: str, body: str, lead_id=None, batch_id=None) -> str:
+    now = datetime.now(timezone.utc)
+    _get_collection(_outbox_collection_name()).insert_one(
+        {
+            "kind": "email",
+            "subject": subject,
+            "body": body,
+            "lead_id": lead_id,
+            "batch_id": batch_id,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now.isoformat(),
+            "next_attempt_at": now,
+        }
+    )
+    _outbox_wakeup.set()
+    return "queued"
+
+
+def _claim_outbox_entry(outbox):
+    now = datetime.now(timezone.utc)
+    # A "sending" entry whose lease expired belongs to a worker that died mid-send.
+    return outbox.find_one_and_update(
+        {"status": {"$in": ["pending", "sending"]}, "next_attempt_at": {"$lte": now}},
+        {
+            "$set": {"status": "sending", "next_attempt_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _outbox_retry_delay(attempts: int) -> float:
+    return min(OUTBOX_BASE_DELAY_SECONDS * (2 ** max(attempts - 1, 0)), OUTBOX_MAX_DELAY_SECONDS)
+
+
+def _deliver_outbox_entry(outbox, entry):
+    with _timed("notify", "smtp_send"):
+        status = _send_email(entry["subject"], entry["body"])
+    _email_status_total.inc(status=status.split(":", 1)[0])
+    now = datetime.now(timezone.utc)
+    final_status = None
+
+    if status in ("sent", "skipped"):
+        outbox.update_one(
+            {"_id": entry["_id"]}, {"$set": {"status": status, "sent_at": now.isoformat(), "finished_at": now}}
+        )
+        final_status = status
+    elif entry.get("attempts", 1) >= OUTBOX_MAX_ATTEMPTS:
+        outbox.update_one(
+            {"_id": entry["_id"]}, {"$set": {"status": "failed", "last_error": status, "finished_at": now}}
+        )
+        final_status = status
+    else:
+        outbox.update_one(
+            {"_id": entry["_id"]},
+            {
+                "$set": {
+                    "status": "pending",
+                    "last_error": status,
+                    "next_attempt_at": now + timedelta(seconds=_outbox_retry_delay(entry.get("attempts", 1))),
+                }
+            },
+        )
+
+    stats_fields = {"created_at": 1, "service_type": 1, "country": 1, "email_status": 1}
+    if final_status and entry.get("lead_id") is not None:
+        with _timed("notify", "email_status_update"):
+            previous = _get_collection(_leads_collection_name()).find_one_and_update(
+                {"_id": entry["lead_id"]}, {"$set": {"email_status": final_status}}, projection=stats_fields
+            )
+        _record_stats(_email_transition_updates([previous] if previous else [], final_status))
+    if final_status and entry.get("batch_id") is not None:
+        leads = _get_collection(_leads_collection_name())
+        with _timed("notify", "email_status_update"):
+            previous = list(leads.find({"batch_id": entry["batch_id"]}, stats_fields))
+            leads.update_many({"batch_id": entry["batch_id"]}, {"$set": {"email_status": final_status}})
+        _record_stats(_email_transition_updates(previous, final_status))
+
+
+def _drain_outbox():
+    outbox = _get_collection(_outbox_collection_name())
+    while not _outbox_stop.is_set():
+        entry = _claim_outbox_entry(outbox)
+        if entry is None:
+            return
+        _deliver_outbox_entry(outbox, entry)
+
+
+# Chat notifications are grouped per session: one digest email once a session has been
+# quiet for CHAT_DIGEST_WINDOW_SECONDS, covering every message since the previous digest.
+CHAT_DIGEST_WINDOW_SECONDS = float(_env("CHAT_DIGEST_WINDOW_SECONDS", default="600"))
+CHAT_DIGEST_BATCH = int(_env("CHAT_DIGEST_BATCH", default="100"))
+
+
+def _chat_digest_body(session_id: str, messages: list) -> str:
+    parts = [f"Session: {session_id}\nMessages: {len(messages)}"]
+    for item in messages:
+        parts.append(f"[{item.get('at')}]\nUser: {item.get('user')}\n\nAssistant: {item.get('assistant')}")
+    return "\n\n---\n\n".join(parts)
+
+
+def _run_chat_digests():
+    sessions = _get_collection(_chat_session_collection_name())
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHAT_DIGEST_WINDOW_SECONDS)
+    pending = sessions.find(
+        {"digest_due": True, "last_message_at": {"$lte": cutoff}},
+        {"session_id": 1, "message_count": 1, "digested_count": 1},
+        limit=CHAT_DIGEST_BATCH,
+    )
+    for session in list(pending):
+        digested = session.get("digested_count", 0)
+        count = session["message_count"]
+        # Compare-and-set on digested_count so concurrent workers send each digest once; the
+        # message_count guard keeps digest_due set when a new message arrived meanwhile.
+        claimed = sessions.update_one(
+            {"_id": session["_id"], "digested_count": session.get("digested_count"), "message_count": count},
+            {"$set": {"digested_count": count}, "$unset": {"digest_due": ""}},
+        )
+        if not claimed.modified_count:
+            continue
+        try:
+            messages = _chat_messages_between(session["session_id"], digested, count)
+            _enqueue_email(
+                f"Chat assistant - {session['session_id']} ({len(messages)} messages)",
+                _chat_digest_body(session["session_id"], messages),
+            )
+        except Exception:
+            sessions.update_one(
+                {"_id": session["_id"], "digested_count": count},
+                {"$set": {"digested_count": digested, "digest_due": True}},
+            )
+            raise
+
+
+def _outbox_worker():
+    while not _outbox_stop.is_set():
+        try:
+            _run_chat_digests()
+        except Exception:
+            pass
+        try:
+            _drain_outbox()
+        except Exception:
+            pass
+        _smtp_session.close_if_idle()
+        _outbox_wakeup.wait(OUTBOX_POLL_SECONDS)
+        _outbox_wakeup.clear()
+
+
+def _start_outbox_worker():
+    global _outbox_thread
+    if _outbox_thread is not None and _outbox_thread.is_alive():
+        return
+    _outbox_stop.clear()
+    _outbox_thread = threading.Thread(target=_outbox_worker, name="outbox-worker", daemon=True)
+    _outbox_thread.start()
+
+
+def _stop_outbox_worker():
+    global _outbox_thread
+    _outbox_stop.set()
+    _outbox_wakeup.set()
+    if _outbox_thread is not None:
+        _outbox_thread.join(timeout=5)
+        _outbox_thread = None
+    _smtp_session.close()
+
+
+# One Cohere client per API key and process; its httpx pool keeps connections alive
+# between calls instead of paying TLS setup on every chat message.
+COHERE_CONNECT_TIMEOUT = float(_env("COHERE_CONNECT_TIMEOUT", default="5"))
+COHERE_READ_TIMEOUT = float(_env("COHERE_READ_TIMEOUT", default="20"))
+COHERE_MAX_CONNECTIONS = int(_env("COHERE_MAX_CONNECTIONS", default="20"))
+
+_cohere_lock = threading.Lock()
+_cohere_clients: dict = {}
+_cohere_stats = _LatencyStats()
+_cohere_first_token_stats = _LatencyStats()
+
+
+def _cohere_client(api_key: str):
+    client = _cohere_clients.get(api_key)
+    if client is not None:
+        return client
+    with _cohere_lock:
+        client = _cohere_clients.get(api_key)
+        if client is None:
+            timeout = httpx.Timeout(COHERE_READ_TIMEOUT, connect=COHERE_CONNECT_TIMEOUT)
+            http_client = httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=COHERE_MAX_CONNECTIONS,
+                    max_keepalive_connections=COHERE_MAX_CONNECTIONS,
+                    keepalive_expiry=60,
+                ),
+            )
+            # The SDK passes its own timeout to every request, so it gets the same limits.
+            client = cohere.ClientV2(api_key=api_key, httpx_client=http_client, timeout=timeout)
+            _cohere_clients[api_key] = client
+    return client
+
+
+def _cohere_chat(api_key: str, model: str, messages: list) -> str:
+    start = time.perf_counter()
+    try:
+        resp = _cohere_client(api_key).chat(model=model, messages=messages)
+        text = resp.message.content[0].text or ""
+    except Exception as exc:
+        _cohere_stats.record((time.perf_counter() - start) * 1000, ok=False)
+        _cohere_errors_total.inc(error=type(exc).__name__)
+        raise
+    _cohere_stats.record((time.perf_counter() - start) * 1000)
+    return text
+
+
+# Resilience layer: every chat call gets a latency budget, and a breaker that opens after
+# COHERE_BREAKER_FAILURES consecutive failed or slow calls sends traffic to the local answers
+# until a single probe succeeds. Short prompts can be hedged with a second request once the
+# first has outlived the recent p95.
+COHERE_BUDGET_SECONDS = float(_env("COHERE_BUDGET_SECONDS", default="8"))
+COHERE_SLOW_CALL_SECONDS = float(_env("COHERE_SLOW_CALL_SECONDS", default="6"))
+COHERE_BREAKER_FAILURES = int(_env("COHERE_BREAKER_FAILURES", default="5"))
+COHERE_BREAKER_OPEN_SECONDS = float(_env("COHERE_BREAKER_OPEN_SECONDS", default="30"))
+COHERE_HEDGE_MAX_CHARS = int(_env("COHERE_HEDGE_MAX_CHARS", default="0"))
+COHERE_HEDGE_MIN_MS = float(_env("COHERE_HEDGE_MIN_MS", default="300"))
+
+
+class _CohereUnavailable(RuntimeError):
+    pass
+
+
+class _CircuitBreaker:
+    def __init__(self, failures: int, open_seconds: float, slow_seconds: float):
+        self.failures = failures
+        self.open_seconds = open_seconds
+        self.slow_seconds = slow_seconds
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.short_circuits = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.short_circuits += 1
+            return False
+
+    def record(self, ok: bool, elapsed: float):
+        with self._lock:
+            if ok and elapsed < self.slow_seconds:
+                self.state = "closed"
+                self.consecutive = 0
+                self._probing = False
+                return
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def release(self):
+        # A call that ended without an outcome (e.g. a closed stream) frees the half-open probe.
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive,
+                "opens": self.opens,
+                "short_circuits": self.short_circuits,
+            }
+
+
+_cohere_breaker = _CircuitBreaker(COHERE_BREAKER_FAILURES, COHERE_BREAKER_OPEN_SECONDS, COHERE_SLOW_CALL_SECONDS)
+# Calls run here so the request thread can stop waiting at the budget; an abandoned call is
+# still bounded by the httpx read timeout.
+_cohere_pool = ThreadPoolExecutor(max_workers=COHERE_MAX_CONNECTIONS, thread_name_prefix="cohere")
+
+
+def _hedge_delay(user_msg: str):
+    if len(user_msg) > COHERE_HEDGE_MAX_CHARS:
+        return None
+    p95 = _cohere_stats.percentile(0.95)
+    if p95 is None:
+        return None
+    return max(p95, COHERE_HEDGE_MIN_MS) / 1000
+
+
+def _cohere_guarded_chat(api_key: str, model: str, messages: list, user_msg: str = "") -> str:
+    if not _cohere_breaker.allow():
+        _cohere_errors_total.inc(error="circuit_open")
+        raise _CohereUnavailable("circuit_open")
+    start = time.perf_counter()
+    deadline = start + COHERE_BUDGET_SECONDS
+    primary = _cohere_pool.submit(_cohere_chat, api_key, model, messages)
+    pending = {primary}
+    hedged = False
+    error: Exception = _CohereUnavailable("budget_exceeded")
+    hedge_after = _hedge_delay(user_msg)
+    if hedge_after is not None and hedge_after < COHERE_BUDGET_SECONDS:
+        done, _ = wait(pending, timeout=hedge_after)
+        if not done:
+            pending.add(_cohere_pool.submit(_cohere_chat, api_key, model, messages))
+            hedged = True
+    while pending:
+        done, pending = wait(pending, timeout=max(deadline - time.perf_counter(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            _cohere_errors_total.inc(error="budget_exceeded")
+            break
+        for future in done:
+            if future.exception() is None:
+                if hedged:
+                    _cohere_hedges_total.inc(winner="primary" if future is primary else "hedge")
+                _cohere_breaker.record(True, time.perf_counter() - start)
+                return future.result()
+            error = future.exception()
+    _cohere_breaker.record(False, time.perf_counter() - start)
+    raise error
+
+
+def _cohere_chat_stream(api_key: str, model: str, messages: list):
+    start = time.perf_counter()
+    first_token = True
+    try:
+        for event in _cohere_client(api_key).chat_stream(model=model, messages=messages):
+            if getattr(event, "type", None) != "content-delta":
+                continue
+            text = event.delta.message.content.text if event.delta and event.delta.message else None
+            if not text:
+                continue
+            if first_token:
+                _cohere_first_token_stats.record((time.perf_counter() - start) * 1000)
+                first_token = False
+            yield text
+    except Exception as exc:
+        _cohere_stats.record((time.perf_counter() - start) * 1000, ok=False)
+        _cohere_errors_total.inc(error=type(exc).__name__)
+        raise
+    _cohere_stats.record((time.perf_counter() - start) * 1000)
+
+
+def _cohere_guarded_stream(api_key: str, model: str, messages: list):
+    # The budget bounds the wait for the first token; once text flows the read timeout applies.
+    if not _cohere_breaker.allow():
+        _cohere_errors_total.inc(error="circuit_open")
+        raise _CohereUnavailable("circuit_open")
+    start = time.perf_counter()
+    stream = _cohere_chat_stream(api_key, model, messages)
+    first = _cohere_pool.submit(next, stream, None)
+    ok = None
+    try:
+        done, _ = wait({first}, timeout=COHERE_BUDGET_SECONDS)
+        if not done:
+            _cohere_errors_total.inc(error="budget_exceeded")
+            raise _CohereUnavailable("budget_exceeded")
+        text = first.result()
+        if text is not None:
+            yield text
+            yield from stream
+        ok = True
+    except Exception:
+        ok = False
+        raise
+    finally:
+        # GeneratorExit (client disconnected) skips both branches above.
+        if ok is None:
+            _cohere_breaker.release()
+        else:
+            _cohere_breaker.record(ok, time.perf_counter() - start)
+
+
 def _assistant_footer():
     return "\n\nWhatsApp: +22892092572"
 
@@ -281,108 +1358,345 @@ def _how_it_works():
     )
 
 
-def _safe_reply(message: str) -> str:
-    msg = message.lower().strip()
-    if not msg:
-        return (
-            "Bonjour et bienvenue. Je peux vous aider sur nos services Candidature, Web et Data "
-            "(Portfolio, Vitrine, CV, Lettre, LinkedIn, Audit, Landing page, Google Business, Dashboard, Base)."
-        ) + _assistant_footer()
-
-    if any(k in msg for k in ["prix", "tarif", "cout", "co?t"]):
-        return (
-            "Merci pour votre question. Voici nos tarifs officiels:\n"
-            + _price_text()
-            + "\n\nSouhaitez-vous commander un seul service ou un pack combine ?"
-            + _assistant_footer()
-        )
+# Every keyword table used to route chat messages, compiled once into a single matcher.
+INTENT_KEYWORDS = {
+    "price": ["prix", "tarif", "cout", "co?t"],
+    "how": ["comment", "marche"],
+    "process": ["process"],
+    "greeting": ["bonjour", "salut", "bonsoir", "hello"],
+    "contact": ["whatsapp", "what's app", "contact", "numero"],
+    "portfolio": ["portfolio"],
+    "vitrine": ["vitrine", "entreprise", "site"],
+    "cv": ["cv", "curriculum"],
+    "lettre": ["lettre", "motivation"],
+    "linkedin": ["linkedin"],
+    "audit": ["audit"],
+    "landing": ["landing"],
+    "google_business": ["google business", "google maps", "fiche google"],
+    "dashboard": ["dashboard"],
+    "base": ["formulaire", "base"],
+    "pack": ["pack", "plusieurs", "combo"],
+    # Service names asked about by the user / expected back in an on-topic reply.
+    "service_asked": [
+        "portfolio",
+        "vitrine",
+        "cv",
+        "lettre",
+        "motivation",
+        "linkedin",
+        "audit",
+        "landing",
+        "google business",
+        "google maps",
+        "dashboard",
+        "formulaire",
+        "base",
+    ],
+    "service_answered": [
+        "portfolio",
+        "vitrine",
+        "cv",
+        "lettre",
+        "motivation",
+        "linkedin",
+        "audit",
+        "landing",
+        "google business",
+        "dashboard",
+        "formulaire",
+        "base",
+    ],
+}
 
-    if "comment" in msg or "marche" in msg or "process" in msg:
-        return (
-            _how_it_works()
-            + "\n\nSi vous voulez, je peux vous orienter vers le formulaire exact selon votre besoin."
-            + _assistant_footer()
-        )
 
-    if any(k in msg for k in ["bonjour", "salut", "bonsoir", "hello"]):
-        return (
-            "Bonjour. Merci de votre message. Dites-moi votre besoin principal: Portfolio, Vitrine, CV, Lettre, LinkedIn, Audit, Landing page, Google Business, Dashboard, Base."
-        ) + _assistant_footer()
-
-    if any(k in msg for k in ["whatsapp", "what's app", "contact", "numero"]):
-        return "WhatsApp: +22892092572" + _assistant_footer()
-
-    if "portfolio" in msg:
-        return (
-            f"Portfolio candidat: {PRICES['portfolio']} CFA (~${_usd(PRICES['portfolio'])}). "
-            f"Hebergement en option. Remplissez le formulaire Portfolio (A) avec vos projets et objectifs."
-        ) + _assistant_footer()
-
-    if any(k in msg for k in ["vitrine", "entreprise", "site"]):
-        return (
-            f"Vitrine entreprise: a partir de {PRICES['vitrine_min']} CFA (~${_usd(PRICES['vitrine_min'])}). "
-            "Hebergement en option. Remplissez le formulaire Vitrine (B) avec offres, preuves et CTA."
-        ) + _assistant_footer()
-
-    if any(k in msg for k in ["cv", "curriculum"]):
-        return (
-            f"CV professionnel: {PRICES['cv']} CFA (~${_usd(PRICES['cv'])}). "
-            "Pas d hebergement. Remplissez le formulaire CV avec experiences et competences."
-        ) + _assistant_footer()
-
-    if any(k in msg for k in ["lettre", "motivation"]):
-        return (
-            f"Lettre de motivation: {PRICES['lm']} CFA (~${_usd(PRICES['lm'])}). "
-            "Pas d hebergement. Remplissez le formulaire Lettre avec contexte et objectifs."
-        ) + _assistant_footer()
-
-    if "linkedin" in msg:
-        return (
-            "Optimisation LinkedIn: profil, resume, experiences et positionnement. "
-            "Remplissez le formulaire LinkedIn avec votre lien et vos objectifs."
-        ) + _assistant_footer()
-
-    if "audit" in msg:
-        return (
-            "Audit CV / Lettre: analyse complete + corrections. "
-            "Envoyez vos fichiers via le formulaire Audit."
-        ) + _assistant_footer()
-
-    if "landing" in msg:
-        return (
-            "Landing page 1 page: offre, preuves, CTA. "
-            "Remplissez le formulaire Landing page avec votre offre principale."
-        ) + _assistant_footer()
-
-    if any(k in msg for k in ["google business", "google maps", "fiche google"]):
-        return (
-            "Google Business Profile: creation/optimisation de votre fiche Google Maps. "
-            "Remplissez le formulaire Google Business pour la categorie, horaires et description."
-        ) + _assistant_footer()
-
-    if "dashboard" in msg:
-        return (
-            "Dashboard simple ONG/PME: indicateurs, suivi et reporting. "
-            "Remplissez le formulaire Dashboard avec vos sources de donnees."
-        ) + _assistant_footer()
-
-    if "formulaire" in msg or "base" in msg:
-        return (
-            "Formulaire + Base structuree: collecte fiable + base propre. "
-            "Remplissez le formulaire Base avec vos champs et besoins d export."
-        ) + _assistant_footer()
-
-    if any(k in msg for k in ["pack", "plusieurs", "combo"]):
-        return (
-            "Oui, vous pouvez combiner plusieurs services dans une seule demande. "
-            "Choisissez le service principal puis cochez les services complementaires."
-        ) + _assistant_footer()
+def _fold(text: str) -> str:
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text.replace("\u2019", "'"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
 
-    return (
+
+def _keyword_regex(keywords) -> str:
+    # Alternation shaped as a trie so each position is tested once per leading character.
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if "" in node else "")
+
+    return build(trie)
+
+
+def _compile_intents(table: dict):
+    owners: dict = {}
+    for intent, keywords in table.items():
+        for keyword in keywords:
+            owners.setdefault(_fold(keyword), set()).add(intent)
+    # The lookahead reports the longest keyword starting at every position, overlaps
+    # included. Each keyword also carries the intents of the keywords it contains, so a
+    # shorter keyword hidden behind a longer one at the same position is never lost.
+    expanded = {
+        keyword: frozenset().union(*(owners[other] for other in owners if other in keyword))
+        for keyword in owners
+    }
+    pattern = re.compile("(?=(" + _keyword_regex(owners) + "))")
+    searches = {
+        intent: re.compile(_keyword_regex(_fold(k) for k in keywords)) for intent, keywords in table.items()
+    }
+    return pattern, expanded, searches
+
+
+_INTENT_PATTERN, _INTENT_OWNERS, _INTENT_SEARCH = _compile_intents(INTENT_KEYWORDS)
+
+
+def _intents(text: str) -> frozenset:
+    found: set = set()
+    for match in _INTENT_PATTERN.finditer(_fold(text)):
+        found |= _INTENT_OWNERS[match.group(1)]
+    return frozenset(found)
+
+
+def _has_intent(text: str, intent: str) -> bool:
+    return _INTENT_SEARCH[intent].search(_fold(text)) is not None
+
+
+def _normalize_query(text: str) -> str:
+    return " ".join(re.sub(r"[^\w']+", " ", _fold(text)).split())
+
+
+CANNED_REPLIES = {
+    "empty": (
+        "Bonjour et bienvenue. Je peux vous aider sur nos services Candidature, Web et Data "
+        "(Portfolio, Vitrine, CV, Lettre, LinkedIn, Audit, Landing page, Google Business, Dashboard, Base)."
+    )
+    + _assistant_footer(),
+    "price": (
+        "Merci pour votre question. Voici nos tarifs officiels:\n"
+        + _price_text()
+        + "\n\nSouhaitez-vous commander un seul service ou un pack combine ?"
+        + _assistant_footer()
+    ),
+    "how": (
+        _how_it_works()
+        + "\n\nSi vous voulez, je peux vous orienter vers le formulaire exact selon votre besoin."
+        + _assistant_footer()
+    ),
+    "greeting": (
+        "Bonjour. Merci de votre message. Dites-moi votre besoin principal: Portfolio, Vitrine, CV, Lettre, LinkedIn, Audit, Landing page, Google Business, Dashboard, Base."
+    )
+    + _assistant_footer(),
+    "contact": "WhatsApp: +22892092572" + _assistant_footer(),
+    "portfolio": (
+        f"Portfolio candidat: {PRICES['portfolio']} CFA (~${_usd(PRICES['portfolio'])}). "
+        f"Hebergement en option. Remplissez le formulaire Portfolio (A) avec vos projets et objectifs."
+    )
+    + _assistant_footer(),
+    "vitrine": (
+        f"Vitrine entreprise: a partir de {PRICES['vitrine_min']} CFA (~${_usd(PRICES['vitrine_min'])}). "
+        "Hebergement en option. Remplissez le formulaire Vitrine (B) avec offres, preuves et CTA."
+    )
+    + _assistant_footer(),
+    "cv": (
+        f"CV professionnel: {PRICES['cv']} CFA (~${_usd(PRICES['cv'])}). "
+        "Pas d hebergement. Remplissez le formulaire CV avec experiences et competences."
+    )
+    + _assistant_footer(),
+    "lettre": (
+        f"Lettre de motivation: {PRICES['lm']} CFA (~${_usd(PRICES['lm'])}). "
+        "Pas d hebergement. Remplissez le formulaire Lettre avec contexte et objectifs."
+    )
+    + _assistant_footer(),
+    "linkedin": (
+        "Optimisation LinkedIn: profil, resume, experiences et positionnement. "
+        "Remplissez le formulaire LinkedIn avec votre lien et vos objectifs."
+    )
+    + _assistant_footer(),
+    "audit": (
+        "Audit CV / Lettre: analyse complete + corrections. "
+        "Envoyez vos fichiers via le formulaire Audit."
+    )
+    + _assistant_footer(),
+    "landing": (
+        "Landing page 1 page: offre, preuves, CTA. "
+        "Remplissez le formulaire Landing page avec votre offre principale."
+    )
+    + _assistant_footer(),
+    "google_business": (
+        "Google Business Profile: creation/optimisation de votre fiche Google Maps. "
+        "Remplissez le formulaire Google Business pour la categorie, horaires et description."
+    )
+    + _assistant_footer(),
+    "dashboard": (
+        "Dashboard simple ONG/PME: indicateurs, suivi et reporting. "
+        "Remplissez le formulaire Dashboard avec vos sources de donnees."
+    )
+    + _assistant_footer(),
+    "base": (
+        "Formulaire + Base structuree: collecte fiable + base propre. "
+        "Remplissez le formulaire Base avec vos champs et besoins d export."
+    )
+    + _assistant_footer(),
+    "pack": (
+        "Oui, vous pouvez combiner plusieurs services dans une seule demande. "
+        "Choisissez le service principal puis cochez les services complementaires."
+    )
+    + _assistant_footer(),
+    "fallback": (
         "Merci pour votre message. Je suis desole, je reponds uniquement aux questions liees a nos services "
         "(Portfolio, Vitrine, CV, Lettre, LinkedIn, Audit, Landing page, Google Business, Dashboard, Formulaire+Base). "
         "Vous pouvez me demander par exemple: 'prix', 'comment ca marche', 'je veux un CV' ou 'je veux un dashboard'."
-    ) + _assistant_footer()
+    )
+    + _assistant_footer(),
+}
+
+# First matching intent wins; "process" shares the how-it-works answer.
+SAFE_REPLY_ORDER = [
+    ("price", "price"),
+    ("how", "how"),
+    ("process", "how"),
+    ("greeting", "greeting"),
+    ("contact", "contact"),
+    ("portfolio", "portfolio"),
+    ("vitrine", "vitrine"),
+    ("cv", "cv"),
+    ("lettre", "lettre"),
+    ("linkedin", "linkedin"),
+    ("audit", "audit"),
+    ("landing", "landing"),
+    ("google_business", "google_business"),
+    ("dashboard", "dashboard"),
+    ("base", "base"),
+    ("pack", "pack"),
+]
+
+
+def _safe_reply(message: str, intents: frozenset | None = None) -> str:
+    msg = message.lower().strip()
+    if not msg:
+        return CANNED_REPLIES["empty"]
+
+    if intents is None:
+        intents = _intents(msg)
+
+    for intent, answer in SAFE_REPLY_ORDER:
+        if intent in intents:
+            return CANNED_REPLIES[answer]
+    return CANNED_REPLIES["fallback"]
+
+
+# Retrieval tier: a character n-gram TF-IDF index over the canned answers, built at import.
+# Each answer is indexed through typical phrasings of the questions that lead to it, so
+# confident matches are answered locally and only ambiguous ones reach Cohere. A match must
+# also explain the whole message: long messages, or ones carrying intents the matched
+# phrasing does not (a greeting aside), always go to the model.
+FAQ_QUESTIONS = {
+    "price": ["quels sont vos prix", "combien ca coute", "vos tarifs", "c est combien", "quel est le cout"],
+    "how": [
+        "comment ca marche",
+        "comment proceder",
+        "quelles sont les etapes",
+        "comment se passe la commande",
+        "quel est le processus",
+    ],
+    "contact": ["donnez moi le whatsapp", "votre numero", "comment vous contacter", "numero whatsapp"],
+    "portfolio": ["je veux un portfolio", "portfolio candidat", "creer mon portfolio"],
+    "vitrine": ["site vitrine", "un site pour mon entreprise", "je veux un site web", "vitrine entreprise"],
+    "cv": ["je veux un cv", "refaire mon cv", "curriculum vitae", "cv professionnel"],
+    "lettre": ["lettre de motivation", "rediger ma lettre", "je veux une lettre de motivation"],
+    "linkedin": ["optimiser mon linkedin", "profil linkedin", "optimisation linkedin"],
+    "audit": ["audit de mon cv", "corriger mon cv", "audit cv lettre"],
+    "landing": ["landing page", "page de vente", "une landing page"],
+    "google_business": ["fiche google maps", "google business profile", "fiche google"],
+    "dashboard": ["je veux un dashboard", "tableau de bord", "dashboard ong"],
+    "base": ["formulaire et base", "base de donnees", "formulaire de collecte"],
+    "pack": ["plusieurs services", "un pack", "combiner des services"],
+}
+FAQ_MIN_SCORE = float(_env("FAQ_MIN_SCORE", default="0.55"))
+FAQ_MIN_MARGIN = float(_env("FAQ_MIN_MARGIN", default="0.15"))
+FAQ_MAX_TOKENS = int(_env("FAQ_MAX_TOKENS", default="8"))
+
+
+def _char_ngrams(text: str) -> dict:
+    grams: dict = {}
+    for word in _normalize_query(text).split():
+        padded = f" {word} "
+        for n in (3, 4):
+            for i in range(max(len(padded) - n + 1, 1)):
+                gram = padded[i : i + n]
+                grams[gram] = grams.get(gram, 0) + 1
+    return grams
+
+
+def _tfidf(grams: dict, idf: dict) -> dict:
+    vector = {gram: (1 + math.log(count)) * idf.get(gram, 0.0) for gram, count in grams.items()}
+    norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+    return {gram: value / norm for gram, value in vector.items() if value}
+
+
+def _build_faq_index():
+    docs = []
+    for answer, questions in FAQ_QUESTIONS.items():
+        for text in questions:
+            docs.append((answer, _char_ngrams(text), _intents(text)))
+    df: dict = {}
+    for _, grams, _ in docs:
+        for gram in grams:
+            df[gram] = df.get(gram, 0) + 1
+    idf = {gram: math.log((1 + len(docs)) / (1 + count)) + 1 for gram, count in df.items()}
+    # Inverted index: a query only touches the postings of its own n-grams.
+    postings: dict = {}
+    for doc_id, (_, grams, _) in enumerate(docs):
+        for gram, weight in _tfidf(grams, idf).items():
+            postings.setdefault(gram, []).append((doc_id, weight))
+    return idf, postings, [answer for answer, _, _ in docs], [intents for _, _, intents in docs]
+
+
+_FAQ_IDF, _FAQ_POSTINGS, _FAQ_ANSWERS, _FAQ_DOC_INTENTS = _build_faq_index()
+
+
+def _faq_scores(message: str) -> list:
+    scores: dict = {}
+    for gram, weight in _tfidf(_char_ngrams(message), _FAQ_IDF).items():
+        for doc_id, doc_weight in _FAQ_POSTINGS.get(gram, ()):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight * doc_weight
+    best: dict = {}
+    for doc_id, score in scores.items():
+        answer = _FAQ_ANSWERS[doc_id]
+        if score > best.get(answer, (0.0, None))[0]:
+            best[answer] = (score, doc_id)
+    ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)
+    return [(answer, score, doc_id) for answer, (score, doc_id) in ranked]
+
+
+def _faq_covers(message: str, doc_id: int) -> bool:
+    if len(_normalize_query(message).split()) > FAQ_MAX_TOKENS:
+        return False
+    return not (_intents(message) - _FAQ_DOC_INTENTS[doc_id] - {"greeting", "service_asked"})
+
+
+_faq_counts = {"local": 0, "ambiguous": 0}
+
+
+def _faq_match(message: str):
+    ranked = _faq_scores(message)
+    if ranked:
+        answer, score, doc_id = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if score >= FAQ_MIN_SCORE and score - runner_up >= FAQ_MIN_MARGIN and _faq_covers(message, doc_id):
+            _faq_counts["local"] += 1
+            return answer
+    _faq_counts["ambiguous"] += 1
+    return None
 
 
 def _is_empty(value) -> bool:
@@ -410,40 +1724,151 @@ def _missing_questions(service_type: str, data: dict):
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "smtp": _smtp_session.stats(),
+        "cohere": _cohere_stats.snapshot(),
+        "cohere_first_token": _cohere_first_token_stats.snapshot(),
+        "cohere_breaker": _cohere_breaker.snapshot(),
+        "chat_cache": _chat_cache.stats(),
+        "chat_histories": _chat_histories.stats(),
+        "faq": dict(_faq_counts),
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    gauges = {
+        "portfolio_chat_cache_entries": _chat_cache.stats()["size"],
+        "portfolio_smtp_connected": int(_smtp_session.stats()["connected"]),
+        "portfolio_cohere_breaker_open": int(_cohere_breaker.snapshot()["state"] != "closed"),
+    }
+    counters = {
+        "portfolio_chat_cache_hits_total": _chat_cache.hits,
+        "portfolio_chat_cache_misses_total": _chat_cache.misses,
+        "portfolio_smtp_reconnects_total": _smtp_session.reconnects,
+        "portfolio_cohere_breaker_opens_total": _cohere_breaker.opens,
+        "portfolio_cohere_short_circuits_total": _cohere_breaker.short_circuits,
+    }
+    for name, value in gauges.items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    for name, value in counters.items():
+        lines += [f"# TYPE {name} counter", f"{name} {value}"]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+# Retries of the same submission (double clicks, client timeouts) carry the same key and get
+# the first response back. Replays that land on the same worker never touch Mongo.
+LEAD_IDEMPOTENCY_TTL_SECONDS = float(_env("LEAD_IDEMPOTENCY_TTL_SECONDS", default="86400"))
+_lead_replays = _TTLCache(int(_env("LEAD_IDEMPOTENCY_CACHE_SIZE", default="2048")), LEAD_IDEMPOTENCY_TTL_SECONDS)
+
+
+def _idempotency_key(payload: dict, header: str | None) -> str | None:
+    raw = header or payload.get("client_request_id")
+    key = str(raw).strip() if raw is not None else ""
+    return key[:128] or None
+
+
+def _payload_fingerprint(payload: dict) -> str:
+    body = {k: v for k, v in payload.items() if k != "client_request_id"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _lead_response(doc: dict) -> dict:
+    return {
+        "status": "ok",
+        "id": str(doc["_id"]),
+        "missing_questions": doc.get("missing_questions", []),
+        "email_status": doc.get("email_status"),
+    }
+
+
+def _replay_lead(key: str, fingerprint: str, doc: dict | None = None):
+    if doc is None:
+        cached = _lead_replays.get(key)
+        if cached is None:
+            return None
+        doc_fingerprint, response = cached
+    else:
+        doc_fingerprint, response = doc.get("payload_fingerprint"), _lead_response(doc)
+        _lead_replays.set(key, (doc_fingerprint, response))
+    if doc_fingerprint != fingerprint:
+        raise HTTPException(status_code=409, detail="idempotency_key_reused")
+    return {**response, "replayed": True}
+
+
+def _bulk_item_error(item) -> str | None:
+    if not isinstance(item, dict):
+        return "not_an_object"
+    if not isinstance(item.get("data", item), dict):
+        return "data_not_an_object"
+    for field in ("service_type", "mode"):
+        if item.get(field) is not None and not isinstance(item[field], str):
+            return f"invalid_{field}"
+    return None
+
+
+def _lead_doc(payload: dict, created_at: str):
+    legacy_mode = payload.get("mode")
+    data = payload.get("data", payload)
+
+    legacy_map = {"A": "portfolio", "B": "vitrine", "CV": "cv", "LM": "lettre"}
+    service_type = payload.get("service_type")
+    if not service_type and isinstance(legacy_mode, str):
+        service_type = legacy_map.get(legacy_mode.upper())
+    if not service_type:
+        service_type = legacy_mode or "unknown"
+
+    missing, questions = _missing_questions(service_type, data)
+
+    doc = {
+        "service_type": service_type,
+        "name": data.get("full_name"),
+        "phone": data.get("phone") or data.get("telephone"),
+        "email": data.get("email"),
+        "country": data.get("country"),
+        "city": data.get("city"),
+        "deadline": data.get("deadline"),
+        "payload": data,
+        "created_at": created_at,
+        "status": "new",
+        "missing_fields": missing,
+        "missing_questions": questions,
+        "email_status": "queued",
+    }
+    return doc, data
 
 
 @app.post("/leads")
-def create_lead(payload: dict):
+def create_lead(payload: dict, idempotency_key: str | None = Header(None)):
+    start = time.perf_counter()
+    key = _idempotency_key(payload, idempotency_key)
+    fingerprint = _payload_fingerprint(payload) if key else None
+    if key:
+        replay = _replay_lead(key, fingerprint)
+        if replay:
+            return replay
     try:
-        collection = _get_collection(os.environ.get("MONGO_COLLECTION", "service_requests"))
-        legacy_mode = payload.get("mode")
-        data = payload.get("data", payload)
-
-        legacy_map = {"A": "portfolio", "B": "vitrine", "CV": "cv", "LM": "lettre"}
-        service_type = payload.get("service_type")
-        if not service_type and isinstance(legacy_mode, str):
-            service_type = legacy_map.get(legacy_mode.upper())
-        if not service_type:
-            service_type = legacy_mode or "unknown"
-
-        missing, questions = _missing_questions(service_type, data)
-
-        doc = {
-            "service_type": service_type,
-            "name": data.get("full_name"),
-            "phone": data.get("phone") or data.get("telephone"),
-            "email": data.get("email"),
-            "country": data.get("country"),
-            "city": data.get("city"),
-            "deadline": data.get("deadline"),
-            "payload": data,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "status": "new",
-            "missing_fields": missing,
-            "missing_questions": questions,
-        }
-        res = collection.insert_one(doc)
+        collection = _get_collection(_leads_collection_name())
+        doc, data = _lead_doc(payload, datetime.now(timezone.utc).isoformat())
+        service_type = doc["service_type"]
+        missing, questions = doc["missing_fields"], doc["missing_questions"]
+        metric_service = _metric_service_type(service_type)
+        if key:
+            doc["idempotency_key"] = key
+            doc["payload_fingerprint"] = fingerprint
+        try:
+            with _timed("leads", "mongo_insert", metric_service):
+                res = collection.insert_one(doc)
+        except DuplicateKeyError:
+            # Another worker stored this submission first: hand back its response, no second email.
+            existing = collection.find_one({"idempotency_key": key}) if key else None
+            if existing is None:
+                raise
+            return _replay_lead(key, fingerprint, existing)
         ref = str(res.inserted_id)
 
         subject = f"Nouveau lead {service_type} - {ref}"
@@ -452,127 +1877,858 @@ def create_lead(payload: dict):
             body = base_body + f"\n\nQuestions utiles: {questions}"
         else:
             body = base_body
-        email_status = _send_email(subject, body)
-        collection.update_one({"_id": res.inserted_id}, {"$set": {"email_status": email_status}})
+        try:
+            with _timed("leads", "outbox_enqueue", metric_service):
+                email_status = _enqueue_email(subject, body, lead_id=res.inserted_id)
+        except Exception as exc:
+            email_status = f"failed: {exc}"
+            with _timed("leads", "email_status_update", metric_service):
+                collection.update_one({"_id": res.inserted_id}, {"$set": {"email_status": email_status}})
+
+        doc["email_status"] = email_status
+        _record_stats(_lead_stats_updates([doc]))
+        _leads_total.inc(service_type=metric_service, complete=str(not missing).lower())
+        _stage_seconds.observe(
+            time.perf_counter() - start, pipeline="leads", stage="total", service_type=metric_service
+        )
+        response = {"status": "ok", "id": ref, "missing_questions": questions, "email_status": email_status}
+        if key:
+            _lead_replays.set(key, (fingerprint, response))
+        return response
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"insert_failed: {exc}")
+
 
-        return {"status": "ok", "id": ref, "missing_questions": questions, "email_status": email_status}
+LEADS_BULK_MAX = int(_env("LEADS_BULK_MAX", default="5000"))
+LEADS_BULK_SUMMARY_LINES = 200
+
+
+def _bulk_summary(batch_id: str, results: list) -> tuple:
+    stored = [r for r in results if r["status"] == "ok"]
+    lines = [
+        f"{r['id']}  {r['service_type']:<16} {len(r['missing_questions'])} question(s) a poser"
+        for r in stored[:LEADS_BULK_SUMMARY_LINES]
+    ]
+    if len(stored) > LEADS_BULK_SUMMARY_LINES:
+        lines.append(f"... et {len(stored) - LEADS_BULK_SUMMARY_LINES} autres")
+    by_service: dict = {}
+    for r in stored:
+        by_service[r["service_type"]] = by_service.get(r["service_type"], 0) + 1
+    totals = ", ".join(f"{service}: {count}" for service, count in sorted(by_service.items()))
+    subject = f"{len(stored)} nouveaux leads (lot {batch_id})"
+    body = f"Lot: {batch_id}\nLeads: {len(stored)} ({totals})\n\n" + "\n".join(lines)
+    return subject, body
+
+
+@app.post("/leads/bulk")
+def create_leads_bulk(payload: dict, x_admin_token: str | None = Header(None)):
+    _require_admin(x_admin_token)
+    start = time.perf_counter()
+    items = payload.get("leads")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="leads_required")
+    if len(items) > LEADS_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"batch_too_large: max {LEADS_BULK_MAX}")
+
+    batch_id = str(ObjectId())
+    created_at = datetime.now(timezone.utc).isoformat()
+    results: list = [None] * len(items)
+    docs, positions = [], []
+    with _timed("leads_bulk", "validate"):
+        for index, item in enumerate(items):
+            error = _bulk_item_error(item)
+            if error:
+                results[index] = {"index": index, "status": "invalid", "error": error}
+                continue
+            doc, _ = _lead_doc(item, created_at)
+            doc["batch_id"] = batch_id
+            key = _idempotency_key(item, None)
+            if key:
+                doc["idempotency_key"] = key
+                doc["payload_fingerprint"] = _payload_fingerprint(item)
+            docs.append(doc)
+            positions.append(index)
+
+    try:
+        collection = _get_collection(_leads_collection_name())
+        write_errors = []
+        if docs:
+            try:
+                # Unordered: one bad document does not stop the rest; insert_many sets every _id first.
+                with _timed("leads_bulk", "mongo_insert"):
+                    collection.insert_many(docs, ordered=False)
+            except BulkWriteError as exc:
+                write_errors = exc.details.get("writeErrors", [])
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"insert_failed: {exc}")
 
+    failed = {error["index"]: error for error in write_errors}
+    duplicates = [
+        docs[i]["idempotency_key"]
+        for i, error in failed.items()
+        if error.get("code") == 11000 and docs[i].get("idempotency_key")
+    ]
+    existing = {}
+    if duplicates:
+        for doc in collection.find({"idempotency_key": {"$in": duplicates}}, {"idempotency_key": 1}):
+            existing[doc["idempotency_key"]] = str(doc["_id"])
+    for doc_index, (doc, index) in enumerate(zip(docs, positions)):
+        error = failed.get(doc_index)
+        if error is None:
+            results[index] = {
+                "index": index,
+                "status": "ok",
+                "id": str(doc["_id"]),
+                "service_type": doc["service_type"],
+                "missing_questions": doc["missing_questions"],
+            }
+            _leads_total.inc(
+                service_type=_metric_service_type(doc["service_type"]),
+                complete=str(not doc["missing_fields"]).lower(),
+            )
+        elif error.get("code") == 11000 and doc.get("idempotency_key") in existing:
+            results[index] = {"index": index, "status": "duplicate", "id": existing[doc["idempotency_key"]]}
+        else:
+            results[index] = {"index": index, "status": "failed", "error": (error.get("errmsg") or "")[:200]}
+
+    inserted = sum(1 for r in results if r["status"] == "ok")
+    email_status = "skipped"
+    if inserted:
+        subject, body = _bulk_summary(batch_id, results)
+        try:
+            with _timed("leads_bulk", "outbox_enqueue"):
+                email_status = _enqueue_email(subject, body, batch_id=batch_id)
+        except Exception as exc:
+            email_status = f"failed: {exc}"
+            collection.update_many({"batch_id": batch_id}, {"$set": {"email_status": email_status}})
+        stored = []
+        for doc_index, doc in enumerate(docs):
+            if doc_index not in failed:
+                doc["email_status"] = email_status
+                stored.append(doc)
+        _record_stats(_lead_stats_updates(stored))
+
+    _stage_seconds.observe(time.perf_counter() - start, pipeline="leads_bulk", stage="total", service_type="")
+    return {
+        "status": "ok",
+        "batch_id": batch_id,
+        "received": len(items),
+        "inserted": inserted,
+        "email_status": email_status,
+        "results": results,
+    }
+
+
+CHAT_SYSTEM_PROMPT = (
+    "Tu es un assistant commercial. Tu aides uniquement sur nos services: "
+    "portfolio candidat, vitrine entreprise, CV, lettre de motivation, optimisation LinkedIn, "
+    "audit CV/lettre, landing page, Google Business Profile, dashboard simple, formulaire + base. "
+    "Reponds en francais, court, clair, utile et concret. "
+    "Sois toujours poli et professionnel. "
+    "Si l utilisateur demande comment ca marche, donne 3-4 etapes. "
+    "Si l utilisateur demande les prix, donne les prix CFA + USD et l hebergement. "
+    "Si la demande est vague, pose UNE question de qualification. "
+    "Si la question est hors de nos services, refuse poliment et recentre vers nos services. "
+    "N invente jamais de service hors la liste ci-dessus. "
+    "Ajoute toujours a la fin: WhatsApp: +22892092572."
+)
+
+
+CHAT_SYSTEM_PROMPT_VERSION = hashlib.sha1(CHAT_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+CHAT_CACHE_SIZE = int(_env("CHAT_CACHE_SIZE", default="512"))
+CHAT_CACHE_TTL_SECONDS = float(_env("CHAT_CACHE_TTL_SECONDS", default="3600"))
+
+
+# Raw model answers keyed on the normalized question; guardrails still run on every hit.
+_chat_cache = _TTLCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL_SECONDS)
+
+
+def _chat_cache_key(model: str, user_msg: str):
+    return model, CHAT_SYSTEM_PROMPT_VERSION, _normalize_query(user_msg)
+
+
+# Recent turns per session, kept per worker so follow-up questions reach Cohere with context.
+# A miss reads the tail of the last two buckets with $slice (one query on session_bucket);
+# the window sent to the model is trimmed to a rough token budget, newest turns first.
+# Each entry remembers the last seq it holds: when the seq returned by the next append is not
+# the one after it, another worker served turns in between and the entry is dropped.
+CHAT_HISTORY_SESSIONS = int(_env("CHAT_HISTORY_SESSIONS", default="1000"))
+CHAT_HISTORY_TURNS = int(_env("CHAT_HISTORY_TURNS", default="8"))
+CHAT_HISTORY_TTL_SECONDS = float(_env("CHAT_HISTORY_TTL_SECONDS", default="1800"))
+CHAT_HISTORY_TOKEN_BUDGET = int(_env("CHAT_HISTORY_TOKEN_BUDGET", default="1200"))
+_chat_histories = _TTLCache(CHAT_HISTORY_SESSIONS, CHAT_HISTORY_TTL_SECONDS)
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text or "") // 4 + 1
+
+
+def _session_history(session_id: str) -> list:
+    if CHAT_HISTORY_TURNS <= 0 or session_id == "session_unknown":
+        return []
+    entry = _chat_histories.get(session_id)
+    if entry is None:
+        turns = deque(maxlen=CHAT_HISTORY_TURNS)
+        try:
+            with _timed("chat", "history_load"):
+                buckets = list(
+                    _get_collection(_chat_collection_name())
+                    .find({"session_id": session_id}, {"messages": {"$slice": -CHAT_HISTORY_TURNS}})
+                    .sort("bucket", -1)
+                    .limit(2)
+                )
+            messages = sorted((m for b in buckets for m in b.get("messages", [])), key=lambda m: m.get("seq", 0))
+            for message in messages[-CHAT_HISTORY_TURNS:]:
+                if message.get("user") and message.get("assistant"):
+                    turns.append((message["user"], message["assistant"]))
+        except Exception:
+            return []
+        entry = {"seq": messages[-1].get("seq", -1) if messages else -1, "turns": turns}
+        _chat_histories.set(session_id, entry)
+    window, used = [], 0
+    for user, assistant in reversed(entry["turns"]):
+        used += _estimate_tokens(user) + _estimate_tokens(assistant)
+        if used > CHAT_HISTORY_TOKEN_BUDGET:
+            break
+        window.append((user, assistant))
+    return window[::-1]
+
+
+def _remember_turn(session_id: str, user_msg: str, reply: str, seq: int | None):
+    # Only sessions already in memory are extended; the others hydrate from chat_logs next time.
+    entry = _chat_histories.get(session_id)
+    if entry is None or not user_msg:
+        return
+    if seq is None or seq != entry["seq"] + 1:
+        _chat_histories.pop(session_id)
+        return
+    entry["turns"].append((user_msg, reply))
+    entry["seq"] = seq
+
+
+def _chat_messages(user_msg: str, history: list = ()) -> list:
+    messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+    for user, assistant in history:
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": assistant})
+    messages.append({"role": "user", "content": user_msg})
+    return messages
+
+
+def _finalize_reply(user_msg: str, reply: str) -> str:
+    asked = _intents(user_msg)
+
+    if not reply:
+        _chat_fallbacks_total.inc(reason="no_model_reply")
+        reply = _safe_reply(user_msg, asked)
+
+    if "service_asked" in asked and not _has_intent(reply, "service_answered"):
+        _chat_fallbacks_total.inc(reason="off_topic")
+        reply = _safe_reply(user_msg, asked)
+
+    if "how" in asked and "1)" not in reply:
+        _chat_fallbacks_total.inc(reason="how_it_works")
+        reply = _how_it_works() + _assistant_footer()
+
+    if "price" in asked and "CFA" not in reply:
+        _chat_fallbacks_total.inc(reason="price")
+        reply = "Voici nos tarifs :\n" + _price_text() + _assistant_footer()
+
+    if "WhatsApp" not in reply:
+        reply = reply + _assistant_footer()
+    return reply
+
+
+# Token buckets in front of /chat, one per session and one per client IP. With
+# CHAT_RATE_LIMIT_DB pointing at a SQLite file, every uvicorn worker on the host shares
+# the same budgets; otherwise each worker enforces its own.
+CHAT_RATE_SESSION_BURST = float(_env("CHAT_RATE_SESSION_BURST", default="10"))
+CHAT_RATE_SESSION_PER_MINUTE = float(_env("CHAT_RATE_SESSION_PER_MINUTE", default="6"))
+CHAT_RATE_IP_BURST = float(_env("CHAT_RATE_IP_BURST", default="30"))
+CHAT_RATE_IP_PER_MINUTE = float(_env("CHAT_RATE_IP_PER_MINUTE", default="20"))
+# Reverse proxies in front of uvicorn that append to X-Forwarded-For (1 on Render). The
+# client address is the entry the outermost trusted proxy appended; anything left of it is
+# client-supplied. 0 ignores the header.
+TRUSTED_PROXY_COUNT = int(_env("TRUSTED_PROXY_COUNT", default="1"))
+
+
+def _refill(tokens: float, updated: float, now: float, burst: float, per_second: float) -> float:
+    return min(burst, tokens + max(now - updated, 0.0) * per_second)
+
+
+class _MemoryTokenBuckets:
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict = OrderedDict()
+
+    def allow(self, limits: list) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, burst, per_second in limits:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                levels.append((key, _refill(tokens, updated, now, burst, per_second)))
+            allowed = all(tokens >= 1 for _, tokens in levels)
+            for key, tokens in levels:
+                self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class _SqliteTokenBuckets:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def allow(self, limits: list) -> bool:
+        now = time.time()
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write is atomic across workers.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, burst, per_second in limits:
+                row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (burst, now)
+                levels.append((key, _refill(tokens, updated, now, burst, per_second)))
+            allowed = all(tokens >= 1 for _, tokens in levels)
+            conn.executemany(
+                "INSERT OR REPLACE INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, tokens - 1 if allowed else tokens, now) for key, tokens in levels],
+            )
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                conn.execute("DELETE FROM token_buckets WHERE updated < ?", (now - 86400,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed
+
+
+_rate_limit_db = _env("CHAT_RATE_LIMIT_DB")
+_chat_buckets = _SqliteTokenBuckets(_rate_limit_db) if _rate_limit_db else _MemoryTokenBuckets()
+
+
+def _client_ip(request: Request) -> str:
+    if TRUSTED_PROXY_COUNT > 0:
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else "unknown"
+
+
+def _chat_allowed(session_id: str, client_ip: str) -> bool:
+    try:
+        return _chat_buckets.allow(
+            [
+                (f"session:{session_id}", CHAT_RATE_SESSION_BURST, CHAT_RATE_SESSION_PER_MINUTE / 60),
+                (f"ip:{client_ip}", CHAT_RATE_IP_BURST, CHAT_RATE_IP_PER_MINUTE / 60),
+            ]
+        )
+    except Exception:
+        # A locked or unavailable limiter store must not take the assistant down.
+        return True
+
+
+def _log_chat(session_id: str, user_msg: str, reply: str, source: str = "") -> int | None:
+    try:
+        return _append_chat_message(
+            session_id,
+            {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "user": user_msg,
+                "assistant": reply,
+                "source": source,
+            },
+        )
+    except Exception:
+        return None
+
 
 @app.post("/chat")
-def chat(payload: dict):
+def chat(payload: dict, request: Request):
     api_key = _env("COHERE_API_KEY", "api_key")
     model = _env("COHERE_MODEL", "model", default="command-a-03-2025")
 
     session_id = payload.get("session_id") or "session_unknown"
     user_msg = (payload.get("message") or "").strip()
 
+    start = time.perf_counter()
+    if not _chat_allowed(session_id, _client_ip(request)):
+        _chat_replies_total.inc(source="throttled")
+        _record_chat_stats("throttled")
+        return {"reply": _safe_reply(user_msg)}
+
     if not user_msg:
+        source = "empty"
         reply = _safe_reply("")
     else:
-        reply = ""
-        if api_key:
-            system = (
-                "Tu es un assistant commercial. Tu aides uniquement sur nos services: "
-                "portfolio candidat, vitrine entreprise, CV, lettre de motivation, optimisation LinkedIn, "
-                "audit CV/lettre, landing page, Google Business Profile, dashboard simple, formulaire + base. "
-                "Reponds en francais, court, clair, utile et concret. "
-                "Sois toujours poli et professionnel. "
-                "Si l utilisateur demande comment ca marche, donne 3-4 etapes. "
-                "Si l utilisateur demande les prix, donne les prix CFA + USD et l hebergement. "
-                "Si la demande est vague, pose UNE question de qualification. "
-                "Si la question est hors de nos services, refuse poliment et recentre vers nos services. "
-                "N invente jamais de service hors la liste ci-dessus. "
-                "Ajoute toujours a la fin: WhatsApp: +22892092572."
-            )
+        with _timed("chat", "faq"):
+            faq_answer = _faq_match(user_msg)
+        cache_key = _chat_cache_key(model, user_msg)
+        history = [] if faq_answer else _session_history(session_id)
+        if faq_answer:
+            source = "faq"
+            reply = CANNED_REPLIES[faq_answer]
+        else:
+            # Cached answers are context-free, so only the first turn of a session may use them.
+            source = "cache"
+            reply = "" if history else _chat_cache.get(cache_key) or ""
+        if not reply and api_key:
+            source = "cohere"
             try:
-                co = cohere.ClientV2(api_key)
-                resp = co.chat(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": system},
-                        {"role": "user", "content": user_msg},
-                    ],
-                )
-                reply = resp.message.content[0].text or ""
+                with _timed("chat", "cohere"):
+                    reply = _cohere_guarded_chat(api_key, model, _chat_messages(user_msg, history), user_msg)
             except Exception:
                 reply = ""
-
+            if reply and not history:
+                _chat_cache.set(cache_key, reply)
         if not reply:
-            reply = _safe_reply(user_msg)
-
-        reply_lower = reply.lower()
-        msg_lower = user_msg.lower()
-
-        if any(
-            k in msg_lower
-            for k in [
-                "portfolio",
-                "vitrine",
-                "cv",
-                "lettre",
-                "motivation",
-                "linkedin",
-                "audit",
-                "landing",
-                "google business",
-                "google maps",
-                "dashboard",
-                "formulaire",
-                "base",
-            ]
-        ) and not any(
-            k in reply_lower
-            for k in [
-                "portfolio",
-                "vitrine",
-                "cv",
-                "lettre",
-                "motivation",
-                "linkedin",
-                "audit",
-                "landing",
-                "google business",
-                "dashboard",
-                "formulaire",
-                "base",
-            ]
-        ):
-            reply = _safe_reply(user_msg)
+            source = "safe_reply"
+        with _timed("chat", "guardrails"):
+            reply = _finalize_reply(user_msg, reply)
+
+    with _timed("chat", "mongo_log"):
+        seq = _log_chat(session_id, user_msg, reply, source)
+    _remember_turn(session_id, user_msg, reply, seq)
+    _chat_replies_total.inc(source=source)
+    _record_chat_stats(source)
+    _stage_seconds.observe(time.perf_counter() - start, pipeline="chat", stage="total", service_type="")
+    return {"reply": reply}
 
-        if ("comment" in user_msg.lower() or "marche" in user_msg.lower()) and "1)" not in reply:
-            reply = _how_it_works() + _assistant_footer()
 
-        if any(k in user_msg.lower() for k in ["prix", "tarif", "cout", "co?t"]) and "CFA" not in reply:
-            reply = "Voici nos tarifs :\n" + _price_text() + _assistant_footer()
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        if "WhatsApp" not in reply:
-            reply = reply + _assistant_footer()
 
+@app.post("/chat/stream")
+def chat_stream(payload: dict, request: Request):
+    api_key = _env("COHERE_API_KEY", "api_key")
+    model = _env("COHERE_MODEL", "model", default="command-a-03-2025")
+
+    session_id = payload.get("session_id") or "session_unknown"
+    user_msg = (payload.get("message") or "").strip()
+    allowed = _chat_allowed(session_id, _client_ip(request))
+
+    def events():
+        start = time.perf_counter()
+        if not allowed:
+            _chat_replies_total.inc(source="throttled")
+            _record_chat_stats("throttled")
+            yield _sse("final", {"reply": _safe_reply(user_msg), "corrected": True})
+            yield _sse("done", {})
+            return
+        if not user_msg:
+            source = "empty"
+            reply = _safe_reply("")
+            yield _sse("final", {"reply": reply, "corrected": True})
+        else:
+            faq_answer = _faq_match(user_msg)
+            cache_key = _chat_cache_key(model, user_msg)
+            history = [] if faq_answer else _session_history(session_id)
+            if faq_answer:
+                raw = CANNED_REPLIES[faq_answer]
+            else:
+                raw = "" if history else _chat_cache.get(cache_key) or ""
+            source = "faq" if faq_answer else "cache"
+            if raw:
+                yield _sse("token", {"text": raw})
+            elif api_key:
+                source = "cohere"
+                streamed = []
+                try:
+                    with _timed("chat_stream", "cohere"):
+                        for text in _cohere_guarded_stream(api_key, model, _chat_messages(user_msg, history)):
+                            streamed.append(text)
+                            yield _sse("token", {"text": text})
+                    raw = "".join(streamed)
+                    if raw and not history:
+                        _chat_cache.set(cache_key, raw)
+                except Exception:
+                    raw = "".join(streamed)
+            if not raw:
+                source = "safe_reply"
+            # Guardrails run on the complete text; the client replaces what it streamed
+            # with this reply whenever "corrected" is true.
+            reply = _finalize_reply(user_msg, raw)
+            yield _sse("final", {"reply": reply, "corrected": reply != raw})
+        seq = _log_chat(session_id, user_msg, reply, source)
+        _remember_turn(session_id, user_msg, reply, seq)
+        _chat_replies_total.inc(source=source)
+        _record_chat_stats(source)
+        _stage_seconds.observe(time.perf_counter() - start, pipeline="chat_stream", stage="total", service_type="")
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Admin listing. Pages are keyed on the last (created_at, _id) seen, so every page is an
+# index range scan whatever its depth; the heavy fields stay out unless requested.
+LEAD_LIST_HIDDEN_FIELDS = ("payload", "missing_questions", "payload_fingerprint")
+LEAD_LIST_OPTIONAL_FIELDS = {"payload", "missing_questions"}
+
+
+def _require_admin(token: str | None):
+    expected = _env("ADMIN_API_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=503, detail="admin_api_disabled")
+    if not token or not hmac.compare_digest(token, expected):
+        raise HTTPException(status_code=401, detail="unauthorized")
+
+
+def _encode_cursor(doc: dict) -> str:
+    raw = f"{doc.get('created_at') or ''}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str):
     try:
-        chat_collection_name = _env("MONGO_CHAT_COLLECTION", "chat_collection", default="chat_logs")
-        chats = _get_collection(chat_collection_name)
-        chats.update_one(
-            {"session_id": session_id},
-            {
-                "$setOnInsert": {"created_at": datetime.now(timezone.utc).isoformat()},
-                "$push": {
-                    "messages": {
-                        "at": datetime.now(timezone.utc).isoformat(),
-                        "user": user_msg,
-                        "assistant": reply,
-                    }
-                },
-            },
-            upsert=True,
-        )
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, _, oid = raw.rpartition("|")
+        return created_at, ObjectId(oid)
     except Exception:
-        pass
+        raise HTTPException(status_code=400, detail="invalid_cursor")
 
-    _send_email(
-        f"Chat assistant - {session_id}",
-        f"User: {user_msg}\n\nAssistant: {reply}",
+
+def _iso_bound(value: str, name: str) -> str:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid_{name}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def _lead_filter(service_type, status, country, created_from, created_to) -> dict:
+    query: dict = {}
+    for field, value in (("service_type", service_type), ("status", status), ("country", country)):
+        if value:
+            query[field] = value
+    created: dict = {}
+    if created_from:
+        created["$gte"] = _iso_bound(created_from, "created_from")
+    if created_to:
+        created["$lt"] = _iso_bound(created_to, "created_to")
+    if created:
+        query["created_at"] = created
+    return query
+
+
+@app.get("/leads")
+def list_leads(
+    service_type: str | None = None,
+    status: str | None = None,
+    country: str | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    include: str = "",
+    x_admin_token: str | None = Header(None),
+):
+    _require_admin(x_admin_token)
+    query = _lead_filter(service_type, status, country, created_from, created_to)
+    if cursor:
+        last_created, last_id = _decode_cursor(cursor)
+        query = {
+            "$and": [
+                query,
+                {
+                    "$or": [
+                        {"created_at": {"$lt": last_created}},
+                        {"created_at": last_created, "_id": {"$lt": last_id}},
+                    ]
+                },
+            ]
+        }
+
+    requested = {field.strip() for field in include.split(",") if field.strip()}
+    unknown = requested - LEAD_LIST_OPTIONAL_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown_include: {', '.join(sorted(unknown))}")
+    projection = {field: 0 for field in LEAD_LIST_HIDDEN_FIELDS if field not in requested}
+
+    try:
+        with _timed("leads_list", "mongo_find"):
+            docs = list(
+                _get_collection(_leads_collection_name())
+                .find(query, projection)
+                .sort([("created_at", -1), ("_id", -1)])
+                .limit(limit + 1)
+            )
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"list_failed: {exc}")
+
+    next_cursor = _encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    items = []
+    for doc in docs[:limit]:
+        doc["id"] = str(doc.pop("_id"))
+        items.append(doc)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/chat/{session_id}/history")
+def chat_history(
+    session_id: str,
+    before: int | None = None,
+    pages: int = Query(1, ge=1, le=20),
+    x_admin_token: str | None = Header(None),
+):
+    _require_admin(x_admin_token)
+    try:
+        return _chat_history_page(session_id, before=before, pages=pages)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"history_failed: {exc}")
+
+
+# Exports stream straight from a Mongo cursor: NDJSON and CSV are written a chunk of rows at
+# a time, XLSX goes through openpyxl's write-only mode into a temp file that is then streamed.
+EXPORT_BATCH_SIZE = int(_env("EXPORT_BATCH_SIZE", default="1000"))
+EXPORT_CHUNK_ROWS = 500
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+LEAD_EXPORT_COLUMNS = [
+    ("id", "Reference"),
+    ("created_at", "Date"),
+    ("service_type", "Service"),
+    ("status", "Statut"),
+    ("email_status", "Notification"),
+    ("missing_fields", "Champs manquants"),
+] + [(f"payload.{field}", label) for field, label in FIELD_LABELS.items()]
+CHAT_EXPORT_COLUMNS = [
+    ("session_id", "Session"),
+    ("seq", "Numero"),
+    ("at", "Date"),
+    ("user", "Utilisateur"),
+    ("assistant", "Assistant"),
+]
+
+
+def _export_cell(value, xlsx: bool = False):
+    if value is None:
+        return ""
+    if isinstance(value, (int, float, bool)):
+        return value
+    if isinstance(value, list):
+        text = " | ".join(str(item) for item in value)
+    elif isinstance(value, dict):
+        text = json.dumps(value, ensure_ascii=False, default=str)
+    else:
+        text = str(value)
+    # openpyxl rejects control characters mid-stream, after the headers are already sent.
+    return ILLEGAL_CHARACTERS_RE.sub("", text) if xlsx else text
+
+
+def _lead_export_row(doc: dict) -> dict:
+    data = doc.get("payload") if isinstance(doc.get("payload"), dict) else {}
+    row = {"id": str(doc["_id"])}
+    for key, _ in LEAD_EXPORT_COLUMNS[1:]:
+        if key.startswith("payload."):
+            field = key[len("payload."):]
+            value = data.get(field)
+            if value is None and field in doc:
+                value = doc[field]
+            row[key] = value
+        else:
+            row[key] = doc.get(key)
+    return row
+
+
+def _lead_export_rows(query: dict):
+    cursor = (
+        _get_collection(_leads_collection_name())
+        .find(query, {"payload_fingerprint": 0, "idempotency_key": 0})
+        .sort([("created_at", -1), ("_id", -1)])
+        .batch_size(EXPORT_BATCH_SIZE)
     )
+    with cursor:
+        for doc in cursor:
+            yield _lead_export_row(doc)
 
-    return {"reply": reply}
+
+def _chat_export_rows(query: dict):
+    cursor = (
+        _get_collection(_chat_collection_name())
+        .find(query, {"session_id": 1, "messages": 1})
+        .sort([("session_id", 1), ("bucket", 1)])
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+    with cursor:
+        for doc in cursor:
+            for message in doc.get("messages", []):
+                yield {
+                    "session_id": doc.get("session_id"),
+                    "seq": message.get("seq"),
+                    "at": message.get("at"),
+                    "user": message.get("user"),
+                    "assistant": message.get("assistant"),
+                }
+
+
+def _ndjson_chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False, default=str))
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+def _csv_chunks(rows, columns: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM lets Excel open the UTF-8 file with accents intact.
+    buffer.write("\ufeff")
+    writer.writerow([label for _, label in columns])
+    count = 0
+    for row in rows:
+        writer.writerow([_export_cell(row.get(key)) for key, _ in columns])
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _xlsx_chunks(rows, columns: list, title: str):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append([label for _, label in columns])
+    for row in rows:
+        sheet.append([_export_cell(row.get(key), xlsx=True) for key, _ in columns])
+    with tempfile.TemporaryFile() as handle:
+        workbook.save(handle)
+        handle.seek(0)
+        while True:
+            chunk = handle.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _export_response(rows, columns: list, fmt: str, name: str):
+    if fmt == "csv":
+        body = _csv_chunks(rows, columns)
+    elif fmt == "xlsx":
+        body = _xlsx_chunks(rows, columns, name)
+    else:
+        body = _ndjson_chunks(rows)
+    filename = f"{name}_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.{fmt}"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/exports/leads")
+def export_leads(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|xlsx)$"),
+    service_type: str | None = None,
+    status: str | None = None,
+    country: str | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    x_admin_token: str | None = Header(None),
+):
+    _require_admin(x_admin_token)
+    query = _lead_filter(service_type, status, country, created_from, created_to)
+    return _export_response(_lead_export_rows(query), LEAD_EXPORT_COLUMNS, format, "leads")
+
+
+@app.get("/exports/chat_logs")
+def export_chat_logs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|xlsx)$"),
+    session_id: str | None = None,
+    x_admin_token: str | None = Header(None),
+):
+    _require_admin(x_admin_token)
+    query = {"session_id": session_id} if session_id else {}
+    return _export_response(_chat_export_rows(query), CHAT_EXPORT_COLUMNS, format, "chat_logs")
+
+
+@app.get("/stats")
+def stats(
+    days: int = Query(30, ge=1, le=366),
+    to: str | None = None,
+    x_admin_token: str | None = Header(None),
+):
+    _require_admin(x_admin_token)
+    try:
+        last_day = datetime.fromisoformat(to).date() if to else datetime.now(timezone.utc).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid_to")
+    end = last_day + timedelta(days=1)
+    start = end - timedelta(days=days)
+    try:
+        with _timed("stats", "mongo_find"):
+            rollups = list(
+                _get_collection(_stats_collection_name()).find(
+                    {"_id": {"$gte": start.isoformat(), "$lt": end.isoformat()}}
+                )
+            )
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"stats_failed: {exc}")
+
+    per_day: dict = {}
+    totals = {"leads": 0, "incomplete": 0, "chat_messages": 0}
+    breakdowns = {"by_service": {}, "by_country": {}, "email": {}, "chat_by_source": {}}
+
+    def _add(target: dict, key: str, value: int):
+        target[key] = target.get(key, 0) + value
+
+    for doc in rollups:
+        day = per_day.setdefault(doc["day"], {"day": doc["day"], "leads": 0, "incomplete": 0, "chat_messages": 0})
+        if doc.get("kind") == "chat":
+            day["chat_messages"] += doc.get("messages", 0)
+            _add(breakdowns["chat_by_source"], doc.get("source", "unknown"), doc.get("messages", 0))
+            continue
+        day["leads"] += doc.get("leads", 0)
+        day["incomplete"] += doc.get("incomplete", 0)
+        _add(breakdowns["by_service"], doc.get("service_type", "unknown"), doc.get("leads", 0))
+        _add(breakdowns["by_country"], doc.get("country", "Unknown"), doc.get("leads", 0))
+        for status, count in (doc.get("email") or {}).items():
+            _add(breakdowns["email"], status, count)
+    for day in per_day.values():
+        for field in totals:
+            totals[field] += day[field]
+    # Delivered notifications move counts out of "queued"; drop the emptied buckets.
+    breakdowns["email"] = {status: count for status, count in breakdowns["email"].items() if count}
+
+    return {
+        "from": start.isoformat(),
+        "to": last_day.isoformat(),
+        **totals,
+        "incomplete_share": round(totals["incomplete"] / totals["leads"], 4) if totals["leads"] else 0.0,
+        **breakdowns,
+        "days": [per_day[day] for day in sorted(per_day)],
+    }
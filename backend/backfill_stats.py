@@ -0,0 +1,24 @@
+# Rebuilds the stats_daily rollups for a range of past days from service_requests and chat_logs.
+# Run from backend/ with MONGO_URI set: python backfill_stats.py [--days 90] [--include-today]
+# Today is skipped by default because the API is still incrementing its rollups.
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from app.main import _rebuild_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild stats_daily rollups from the raw collections.")
+    parser.add_argument("--days", type=int, default=90, help="number of days to rebuild")
+    parser.add_argument("--include-today", action="store_true", help="also rebuild the current day")
+    args = parser.parse_args()
+
+    today = datetime.now(timezone.utc).date()
+    end = today + timedelta(days=1) if args.include_today else today
+    start = end - timedelta(days=args.days)
+    result = _rebuild_stats(start.isoformat(), end.isoformat())
+    print(f"Rebuilt {start} .. {end - timedelta(days=1)}: {result['rollups']} rollups, {result['removed']} stale removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Microbenchmark: compiled intent matcher vs. the former keyword any() chains.
+# Run from backend/: python bench_intents.py
+import timeit
+
+from app.main import _finalize_reply, _has_intent, _intents, _safe_reply
+
+MESSAGES = [
+    "Bonjour, quels sont vos prix ?",
+    "Comment ca marche pour un portfolio ?",
+    "je veux un CV en anglais",
+    "Quel est le coût d une vitrine entreprise avec hebergement ?",
+    "Pouvez-vous creer ma fiche Google Maps et un dashboard ?",
+    "Je voudrais un pack CV + lettre de motivation + LinkedIn",
+    "Quelle est la meteo demain a Lome ?",
+    "",
+]
+REPLY = "Voici une reponse generique sans les mots attendus. WhatsApp: +22892092572"
+
+SERVICE_ASKED = [
+    "portfolio", "vitrine", "cv", "lettre", "motivation", "linkedin", "audit", "landing",
+    "google business", "google maps", "dashboard", "formulaire", "base",
+]
+SERVICE_ANSWERED = [k for k in SERVICE_ASKED if k != "google maps"]
+
+
+def legacy_route(message: str) -> str:
+    msg = message.lower().strip()
+    if not msg:
+        return "empty"
+    if any(k in msg for k in ["prix", "tarif", "cout", "co?t"]):
+        return "price"
+    if "comment" in msg or "marche" in msg or "process" in msg:
+        return "how"
+    if any(k in msg for k in ["bonjour", "salut", "bonsoir", "hello"]):
+        return "greeting"
+    if any(k in msg for k in ["whatsapp", "what's app", "contact", "numero"]):
+        return "contact"
+    if "portfolio" in msg:
+        return "portfolio"
+    if any(k in msg for k in ["vitrine", "entreprise", "site"]):
+        return "vitrine"
+    if any(k in msg for k in ["cv", "curriculum"]):
+        return "cv"
+    if any(k in msg for k in ["lettre", "motivation"]):
+        return "lettre"
+    if "linkedin" in msg:
+        return "linkedin"
+    if "audit" in msg:
+        return "audit"
+    if "landing" in msg:
+        return "landing"
+    if any(k in msg for k in ["google business", "google maps", "fiche google"]):
+        return "google_business"
+    if "dashboard" in msg:
+        return "dashboard"
+    if "formulaire" in msg or "base" in msg:
+        return "base"
+    if any(k in msg for k in ["pack", "plusieurs", "combo"]):
+        return "pack"
+    return "fallback"
+
+
+def legacy_finalize(user_msg: str, reply: str):
+    reply_lower = reply.lower()
+    msg_lower = user_msg.lower()
+    off_topic = any(k in msg_lower for k in SERVICE_ASKED) and not any(
+        k in reply_lower for k in SERVICE_ANSWERED
+    )
+    how = ("comment" in user_msg.lower() or "marche" in user_msg.lower()) and "1)" not in reply
+    price = any(k in user_msg.lower() for k in ["prix", "tarif", "cout", "co?t"]) and "CFA" not in reply
+    return legacy_route(user_msg), off_topic, how, price
+
+
+def compiled_finalize(user_msg: str, reply: str):
+    asked = _intents(user_msg)
+    off_topic = "service_asked" in asked and not _has_intent(reply, "service_answered")
+    return asked, off_topic, "how" in asked and "1)" not in reply, "price" in asked and "CFA" not in reply
+
+
+def main():
+    number = 20000
+    for label, fn in (("legacy any() chains", legacy_finalize), ("compiled matcher", compiled_finalize)):
+        elapsed = timeit.timeit(lambda: [fn(m, REPLY) for m in MESSAGES], number=number)
+        per_message_us = elapsed / (number * len(MESSAGES)) * 1e6
+        print(f"{label:<22} {per_message_us:7.2f} us/message")
+
+    # The end-to-end guardrail path, for reference.
+    elapsed = timeit.timeit(lambda: [_finalize_reply(m, REPLY) for m in MESSAGES if m], number=2000)
+    print(f"{'_finalize_reply':<22} {elapsed / (2000 * (len(MESSAGES) - 1)) * 1e6:7.2f} us/message")
+
+    for message in MESSAGES:
+        print(f"{legacy_route(message):<16} {_safe_reply(message)[:60]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Applies the index registry and explains every known query shape; exits non-zero when a
+# shape is answered by a collection scan.
+# Run from backend/ with MONGO_URI set: python check_indexes.py [--no-apply]
+import argparse
+import os
+import sys
+
+from app.main import _ensure_indexes, _get_collection, _query_shapes
+
+# Collections written by the Streamlit app (app.py) in the same database.
+STREAMLIT_LEADS = os.environ.get("STREAMLIT_LEADS_COLLECTION", "leads")
+STREAMLIT_SHAPES = [
+    (STREAMLIT_LEADS, {"email": "lead@example.com"}, None),
+    (STREAMLIT_LEADS, {"lead_status": "new"}, [("created_at", -1)]),
+    (STREAMLIT_LEADS, {"lead_mode": "A"}, [("created_at", -1)]),
+    ("fs.files", {"metadata.lead_email": "lead@example.com"}, None),
+]
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+def _winning_plan(explain: dict) -> dict:
+    planner = explain.get("queryPlanner", {})
+    plan = planner.get("winningPlan", {})
+    return plan.get("queryPlan", plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify that every known query shape uses an index.")
+    parser.add_argument("--no-apply", action="store_true", help="do not create missing indexes first")
+    parser.add_argument("--skip-streamlit", action="store_true", help="only check API collections")
+    args = parser.parse_args()
+
+    if not args.no_apply:
+        for name, error in _ensure_indexes().items():
+            print(f"index creation failed on {name}: {error}")
+
+    shapes = _query_shapes() + ([] if args.skip_streamlit else STREAMLIT_SHAPES)
+    failures = 0
+    for name, query, sort in shapes:
+        cursor = _get_collection(name).find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = [stage for stage in _stages(_winning_plan(cursor.explain())) if stage]
+        scan = "COLLSCAN" in stages
+        failures += scan
+        print(f"{'FAIL' if scan else 'ok  '} {name:<24} {query} sort={sort} -> {' <- '.join(stages)}")
+
+    if failures:
+        print(f"\n{failures} query shape(s) fall back to COLLSCAN")
+        sys.exit(1)
+    print("\nAll query shapes use an index.")
+
+
+if __name__ == "__main__":
+    main()
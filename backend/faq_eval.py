@@ -0,0 +1,114 @@
+# Offline evaluation of the local FAQ tier against user messages replayed from chat_logs.
+# Run from backend/ with MONGO_URI (and optionally MONGO_DB / MONGO_CHAT_COLLECTION) set:
+#   python faq_eval.py [--limit 5000] [--show 20]
+# The regression cases below run first and need no database (--cases-only skips the replay).
+import argparse
+import sys
+from collections import Counter
+
+from app.main import (
+    FAQ_MIN_MARGIN,
+    FAQ_MIN_SCORE,
+    SAFE_REPLY_ORDER,
+    _chat_collection_name,
+    _faq_covers,
+    _faq_match,
+    _faq_scores,
+    _get_collection,
+    _intents,
+)
+
+# (message, expected local answer or None when the message must reach the model)
+REGRESSION_CASES = [
+    ("Bonjour, j ai besoin d aide pour mon CV en anglais, c est urgent", None),
+    ("bonjour", None),
+    ("refaire mon cv et ma lettre", None),
+    ("Bonjour, quels sont vos prix ?", "price"),
+    ("comment ca marche", "how"),
+    ("audit de mon cv", "audit"),
+]
+
+
+def _keyword_answer(message: str):
+    intents = _intents(message)
+    for intent, answer in SAFE_REPLY_ORDER:
+        if intent in intents:
+            return answer
+    return None
+
+
+def _replay_messages(limit: int):
+    chats = _get_collection(_chat_collection_name())
+    seen = 0
+    for doc in chats.find({}, {"messages.user": 1}).batch_size(500):
+        for item in doc.get("messages", []):
+            message = (item.get("user") or "").strip()
+            if not message:
+                continue
+            yield message
+            seen += 1
+            if seen >= limit:
+                return
+
+
+def _check_regressions() -> int:
+    failures = 0
+    for message, expected in REGRESSION_CASES:
+        got = _faq_match(message)
+        if got != expected:
+            failures += 1
+            print(f"REGRESSION faq={got} expected={expected} {message!r}")
+    print(f"Regression cases: {len(REGRESSION_CASES) - failures}/{len(REGRESSION_CASES)} ok\n")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay chat_logs messages through the FAQ tier.")
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--show", type=int, default=20, help="disagreements to print")
+    parser.add_argument("--cases-only", action="store_true", help="only run the regression cases")
+    args = parser.parse_args()
+
+    failures = _check_regressions()
+    if args.cases_only:
+        sys.exit(1 if failures else 0)
+
+    rows = []
+    for message in _replay_messages(args.limit):
+        ranked = _faq_scores(message)
+        top, score, doc_id = ranked[0] if ranked else (None, 0.0, None)
+        margin = score - (ranked[1][1] if len(ranked) > 1 else 0.0)
+        # Messages the match does not fully explain never answer locally, whatever the score.
+        if doc_id is None or not _faq_covers(message, doc_id):
+            score = 0.0
+        rows.append((message, top, score, margin, _keyword_answer(message)))
+
+    if not rows:
+        print("No chat messages found.")
+        return
+
+    print(f"Replayed messages: {len(rows)}")
+    print(f"Thresholds in use: score >= {FAQ_MIN_SCORE}, margin >= {FAQ_MIN_MARGIN}\n")
+    print("min_score  local_rate  agreement_with_keyword_router")
+    for threshold in (0.35, 0.45, 0.55, 0.65, 0.75):
+        local = [r for r in rows if r[2] >= threshold and r[3] >= FAQ_MIN_MARGIN]
+        labelled = [r for r in local if r[4]]
+        agree = sum(1 for r in labelled if r[1] == r[4])
+        rate = len(local) / len(rows)
+        agreement = agree / len(labelled) if labelled else 0.0
+        print(f"{threshold:9.2f}  {rate:10.1%}  {agreement:29.1%}")
+
+    local = [r for r in rows if r[2] >= FAQ_MIN_SCORE and r[3] >= FAQ_MIN_MARGIN]
+    print("\nLocal answers by intent:")
+    for answer, count in Counter(r[1] for r in local).most_common():
+        print(f"  {answer:<16} {count}")
+
+    disagreements = [r for r in local if r[4] and r[1] != r[4]]
+    if disagreements:
+        print(f"\nDisagreements with the keyword router ({len(disagreements)}):")
+        for message, top, score, margin, keyword in disagreements[: args.show]:
+            print(f"  {score:.2f}/{margin:.2f} faq={top:<16} keywords={keyword:<16} {message[:80]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -59,19 +59,11 @@ export default function AssistantWidget() {
     setMessages((current) => [...current, { role: "user", text }]);
 
     try {
-      const response = await fetch(`${API_BASE}/chat`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          session_id: sessionId,
-          message: text,
-        }),
-      });
-      const result = await response.json().catch(() => ({}));
-      const reply =
-        result.reply ||
-        "Merci pour votre message. Je peux vous aider uniquement sur nos services. WhatsApp: +22892092572";
-      setMessages((current) => [...current, { role: "bot", text: reply }]);
+      const streamed = await streamReply(text);
+      if (!streamed) {
+        const reply = await fetchReply(text);
+        setMessages((current) => [...current, { role: "bot", text: reply }]);
+      }
     } catch (_error) {
       setMessages((current) => [
         ...current,
@@ -85,6 +77,88 @@ export default function AssistantWidget() {
     }
   };
 
+  const fetchReply = async (text) => {
+    const response = await fetch(`${API_BASE}/chat`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        session_id: sessionId,
+        message: text,
+      }),
+    });
+    const result = await response.json().catch(() => ({}));
+    return (
+      result.reply ||
+      "Merci pour votre message. Je peux vous aider uniquement sur nos services. WhatsApp: +22892092572"
+    );
+  };
+
+  // Reads Server-Sent Events from /chat/stream: "token" events are appended to the
+  // last bot message, the "final" event carries the corrected reply.
+  const streamReply = async (text) => {
+    const response = await fetch(`${API_BASE}/chat/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+      body: JSON.stringify({
+        session_id: sessionId,
+        message: text,
+      }),
+    });
+    if (!response.ok || !response.body) {
+      return false;
+    }
+
+    const setBotText = (updater) => {
+      setMessages((current) => {
+        const last = current[current.length - 1];
+        const previous = last && last.streaming ? last.text : "";
+        const next = { role: "bot", text: updater(previous), streaming: true };
+        return last && last.streaming ? [...current.slice(0, -1), next] : [...current, next];
+      });
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let finished = false;
+    while (!finished) {
+      const { value, done } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf("\n\n");
+      while (boundary !== -1) {
+        const chunk = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf("\n\n");
+
+        let event = "message";
+        let data = "";
+        chunk.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) {
+            event = line.slice(6).trim();
+          } else if (line.startsWith("data:")) {
+            data += line.slice(5).trim();
+          }
+        });
+        const payload = data ? JSON.parse(data) : {};
+        if (event === "token") {
+          setBotText((previous) => previous + (payload.text || ""));
+        } else if (event === "final") {
+          setBotText(() => payload.reply || "");
+        } else if (event === "done") {
+          finished = true;
+        }
+      }
+    }
+
+    setMessages((current) =>
+      current.map((item) => (item.streaming ? { role: item.role, text: item.text } : item))
+    );
+    return true;
+  };
+
   const onSubmit = async (event) => {
     event.preventDefault();
     if (!canSend) {
@@ -1,4 +1,4 @@
-import { useMemo, useState } from "react";
+import { useMemo, useRef, useState } from "react";
 import { useRouter } from "next/router";
 import {
   CONTACT_EMAIL,
@@ -537,12 +537,21 @@ function formDataToPayload(form) {
   return data;
 }
 
+function newIdempotencyKey() {
+  if (typeof window !== "undefined" && window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `lead_${Date.now().toString(36)}_${Math.random().toString(36).slice(2, 10)}`;
+}
+
 export default function OrderServicePage() {
   const router = useRouter();
   const serviceId = Array.isArray(router.query.service) ? router.query.service[0] : router.query.service;
   const service = useMemo(() => getServiceById(serviceId), [serviceId]);
   const [submitting, setSubmitting] = useState(false);
   const [notice, setNotice] = useState({ type: "", text: "" });
+  // Same body => same key, so a retry after a timeout or double click is replayed, not re-inserted.
+  const pendingSubmission = useRef(null);
 
   if (!service && serviceId) {
     return (
@@ -578,17 +587,25 @@ export default function OrderServicePage() {
     const form = event.currentTarget;
     const data = formDataToPayload(form);
 
+    const body = JSON.stringify({
+      service_type: service.id,
+      data,
+    });
+    if (!pendingSubmission.current || pendingSubmission.current.body !== body) {
+      pendingSubmission.current = { body, key: newIdempotencyKey() };
+    }
+
     setSubmitting(true);
     setNotice({ type: "info", text: "Envoi en cours..." });
 
     try {
       const response = await fetch(`${API_BASE}/leads`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          service_type: service.id,
-          data,
-        }),
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": pendingSubmission.current.key,
+        },
+        body,
       });
 
       const result = await response.json().catch(() => ({}));
@@ -598,6 +615,7 @@ export default function OrderServicePage() {
 
       const reference = result.id || "n/a";
       setNotice({ type: "success", text: `Demande recue. Reference: ${reference}.` });
+      pendingSubmission.current = null;
       form.reset();
     } catch (error) {
       setNotice({ type: "error", text: `Erreur d envoi: ${error.message}` });